@@ -0,0 +1,131 @@
+"""Async read path for the API under ASGI.
+
+Enabled with API_ASYNC_VIEWS=True. GET requests of the wrapped viewsets
+run in a bounded thread pool instead of Django's single thread for sync
+views, so one worker can wait on several database calls at once. Other
+methods keep the default thread-sensitive sync path.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.urls import URLPattern
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from api.cache import (USER_FLAG_QUERIES, USER_FLAGS_TIMEOUT,
+                       get_user_flag_ids, get_user_flags, get_user_flags_key)
+from api.fragments import RecipeCacheMixin
+from api.middleware import record_queries
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_DB_WORKERS,
+    thread_name_prefix='async-db'
+)
+
+
+def database_sync_to_async(func):
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            with record_queries():
+                return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False, executor=executor)
+
+
+def buffer_streaming(view):
+    # Django 3.2 iterates streaming content inside the event loop under
+    # ASGI, where generators that query the database are not allowed.
+    def read(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if not response.streaming:
+            return response
+        buffered = HttpResponse(
+            b''.join(response.streaming_content),
+            status=response.status_code
+        )
+        for header, value in response.items():
+            buffered[header] = value
+        return buffered
+    return read
+
+
+def get_request_user(request):
+    request = Request(request, authenticators=[
+        authentication()
+        for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ])
+    try:
+        return request.user
+    except APIException:
+        return AnonymousUser()
+
+
+def get_cached_user_flags(request):
+    user = get_request_user(request)
+    if user.is_anonymous:
+        return user, get_user_flags(user)
+    return user, cache.get(get_user_flags_key(user.id))
+
+
+async def get_user_flags_async(request):
+    user, flags = await database_sync_to_async(get_cached_user_flags)(
+        request
+    )
+    if flags is None:
+        ids = await asyncio.gather(*(
+            database_sync_to_async(get_user_flag_ids)(user, name)
+            for name in USER_FLAG_QUERIES
+        ))
+        flags = dict(zip(USER_FLAG_QUERIES, ids))
+        await database_sync_to_async(cache.set)(
+            get_user_flags_key(user.id), flags, USER_FLAGS_TIMEOUT
+        )
+    return flags
+
+
+def async_read_view(view):
+    run_read = database_sync_to_async(buffer_streaming(view))
+    run_write = sync_to_async(view)
+    renders_flags = (
+        issubclass(view.cls, RecipeCacheMixin)
+        and view.actions.get('get') in ('list', 'retrieve')
+    )
+
+    async def async_view(request, *args, **kwargs):
+        if request.method not in READ_METHODS:
+            return await run_write(request, *args, **kwargs)
+        if not renders_flags or not view.cls.is_cacheable(request):
+            return await run_read(request, *args, **kwargs)
+        request.defer_user_flags = True
+        response, flags = await asyncio.gather(
+            run_read(request, *args, **kwargs),
+            get_user_flags_async(request)
+        )
+        if getattr(response, 'user_flags_pending', False):
+            response.render_flags(flags)
+        return response
+
+    async_view.csrf_exempt = True
+    async_view.cls = view.cls
+    async_view.initkwargs = view.initkwargs
+    async_view.actions = view.actions
+    return async_view
+
+
+def make_async_read_urls(urlpatterns, viewsets):
+    for pattern in urlpatterns:
+        if (isinstance(pattern, URLPattern)
+                and getattr(pattern.callback, 'cls', None) in viewsets):
+            pattern.callback = async_read_view(pattern.callback)
+    return urlpatterns
@@ -0,0 +1,82 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from api.metrics import registry
+
+
+class LRUCache:
+    """Thread-safe in-process cache bounded by size, with per-entry TTL."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+local_token_cache = LRUCache(settings.TOKEN_CACHE_SIZE)
+
+
+def get_token_cache():
+    if settings.TOKEN_CACHE_ALIAS:
+        return caches[settings.TOKEN_CACHE_ALIAS]
+    return local_token_cache
+
+
+def get_token_cache_key(key):
+    return 'auth_token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidate_token(key):
+    get_token_cache().delete(get_token_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that keeps the token owner in a cache.
+
+    Saves the Token/User query on every authenticated request. Entries
+    are dropped when the token is deleted or the user is saved.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        cache_key = get_token_cache_key(key)
+        user = cache.get(cache_key)
+        if user is None:
+            registry.inc('api_token_cache_requests_total', result='miss')
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, user, settings.TOKEN_CACHE_TIMEOUT)
+            return user, token
+        registry.inc('api_token_cache_requests_total', result='hit')
+        user = copy.copy(user)
+        return user, Token(key=key, user=user)
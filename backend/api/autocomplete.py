@@ -0,0 +1,86 @@
+import threading
+import time
+from bisect import bisect_left
+
+from api.cache import get_version
+from recipes.models import Ingredient
+
+INDEX_TTL = 300
+NGRAM_SIZE = 3
+
+
+class IngredientIndex:
+    """Sorted case-folded prefix index with trigram substring lookup.
+
+    Rebuilt lazily after invalidate(), when the shared 'ingredients'
+    version changes or when the TTL expires, so changes made in other
+    processes are picked up as well.
+    """
+
+    def __init__(self, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._state = None
+        self._version = None
+        self._built_at = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+    def _build(self):
+        rows = sorted(
+            (name.casefold(), id, name, measurement_unit)
+            for id, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        )
+        keys = [row[0] for row in rows]
+        ingredients = [
+            Ingredient(id=id, name=name, measurement_unit=measurement_unit)
+            for _, id, name, measurement_unit in rows
+        ]
+        ngrams = {}
+        for position, key in enumerate(keys):
+            for ngram in {
+                key[i:i + NGRAM_SIZE]
+                for i in range(len(key) - NGRAM_SIZE + 1)
+            }:
+                ngrams.setdefault(ngram, []).append(position)
+        return keys, ingredients, ngrams
+
+    def _get_state(self):
+        version = get_version('ingredients')
+        with self._lock:
+            if (self._state is None
+                    or self._version != version
+                    or time.monotonic() - self._built_at > self.ttl):
+                self._state = self._build()
+                self._version = version
+                self._built_at = time.monotonic()
+            return self._state
+
+    def search(self, query):
+        query = query.casefold()
+        keys, ingredients, ngrams = self._get_state()
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + chr(0x10FFFF), lo=start)
+        if len(query) < NGRAM_SIZE:
+            candidates = range(len(keys))
+        else:
+            postings = sorted(
+                (ngrams.get(query[i:i + NGRAM_SIZE], ())
+                 for i in range(len(query) - NGRAM_SIZE + 1)),
+                key=len
+            )
+            candidates = set(postings[0]).intersection(*postings[1:])
+        substring_matches = sorted(
+            position for position in candidates
+            if not start <= position < end and query in keys[position]
+        )
+        return ingredients[start:end] + [
+            ingredients[position] for position in substring_matches
+        ]
+
+
+ingredient_index = IngredientIndex()
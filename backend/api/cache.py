@@ -0,0 +1,114 @@
+import hashlib
+import time
+
+from django.core.cache import cache, caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+RECIPE_CACHE_TIMEOUT = 60 * 5
+USER_FLAGS_TIMEOUT = 60 * 60
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+USER_SPECIFIC_PARAMS = ('is_favorited', 'is_in_shopping_cart')
+
+local_cache = caches['local']
+
+
+def get_version(name):
+    key = f'version:{name}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    cache.set(f'version:{name}', time.time_ns(), timeout=None)
+
+
+def get_query_hash(request):
+    query = sorted(request.query_params.lists())
+    return hashlib.md5(repr(query).encode()).hexdigest()
+
+
+class ReferenceCacheMixin:
+    reference_name = None
+
+    def list(self, request, *args, **kwargs):
+        version = get_version(self.reference_name)
+        query_hash = get_query_hash(request)
+        etag = f'"{self.reference_name}-{version}-{query_hash}"'
+        last_modified = version // 10 ** 9
+
+        if_none_match = request.headers.get('If-None-Match')
+        if_modified_since = parse_http_date_safe(
+            request.headers.get('If-Modified-Since', '')
+        )
+        if (etag in (if_none_match or '')
+                or (if_none_match is None
+                    and if_modified_since is not None
+                    and last_modified <= if_modified_since)):
+            response = HttpResponseNotModified()
+        else:
+            key = f'reference:{self.reference_name}:{version}:{query_hash}'
+            content = local_cache.get(key)
+            if content is None:
+                content = JSONRenderer().render(
+                    super().list(request, *args, **kwargs).data
+                )
+                local_cache.set(key, content, REFERENCE_CACHE_TIMEOUT)
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+def get_user_flags_key(user_id):
+    return f'user_flags:{user_id}'
+
+
+USER_FLAG_QUERIES = {
+    'favorites': (Favorite, 'recipe_id'),
+    'cart': (ShoppingCart, 'recipe_id'),
+    'subscriptions': (Subscription, 'author_id'),
+}
+
+
+def get_user_flag_ids(user, name):
+    model, field = USER_FLAG_QUERIES[name]
+    return set(model.objects.filter(user=user).values_list(field, flat=True))
+
+
+def get_user_flags(user):
+    if user.is_anonymous:
+        return {name: set() for name in USER_FLAG_QUERIES}
+    key = get_user_flags_key(user.id)
+    flags = cache.get(key)
+    if flags is None:
+        flags = {
+            name: get_user_flag_ids(user, name)
+            for name in USER_FLAG_QUERIES
+        }
+        cache.set(key, flags, USER_FLAGS_TIMEOUT)
+    return flags
+
+
+def invalidate_user_flags(user_id):
+    cache.delete(get_user_flags_key(user_id))
+
+
+def get_fragment_key(generation, kind, pk):
+    return f'fragment:{generation}:{kind}:{pk}'
+
+
+def invalidate_fragments(kind, ids):
+    # Rendered recipe and author fragments, see api.fragments.
+    generation = get_version('fragments')
+    cache.delete_many([get_fragment_key(generation, kind, pk) for pk in ids])
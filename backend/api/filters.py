@@ -1,8 +1,15 @@
 from django_filters.rest_framework import FilterSet, filters
 
 from recipes.models import Recipe, Tag
+from recipes.search import search_recipes
 from users.models import User
 
+DEFAULT_RECIPE_ORDERING = ('-pub_date', '-id')
+RECIPE_ORDERINGS = {
+    'popular': ('-favorites_count', '-pub_date', '-id'),
+    'trending': ('-trending_score', '-pub_date', '-id'),
+}
+
 
 class RecipeFilter(FilterSet):
     is_favorited = filters.BooleanFilter(
@@ -21,6 +28,14 @@ class RecipeFilter(FilterSet):
         to_field_name='id',
         queryset=User.objects.all()
     )
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.ChoiceFilter(
+        choices=(
+            ('popular', 'По популярности'),
+            ('trending', 'Популярные за последнее время'),
+        ),
+        method='get_ordering'
+    )
 
     class Meta:
         model = Recipe
@@ -29,14 +44,22 @@ class RecipeFilter(FilterSet):
             'is_in_shopping_cart',
             'tags',
             'author',
+            'search',
+            'ordering',
         )
 
     def get_is_favorited(self, queryset, name, value):
         if value:
-            return queryset.filter(favorites__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if value:
-            return queryset.filter(cart__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
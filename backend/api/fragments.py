@@ -0,0 +1,271 @@
+"""Pre-encoded JSON fragments of the recipe read payload.
+
+The user-independent part of RecipeReadSerializer output is stored per
+recipe and per author as JSON split around placeholders. Responses are
+assembled by splicing the fragments with the current user's flags and
+absolute image URLs, so cached pages cost no serializer work at all.
+Fragments are regenerated or dropped by the signals in api.signals.
+"""
+import json
+import re
+
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from rest_framework.fields import SerializerMethodField
+from rest_framework.generics import get_object_or_404
+from rest_framework.renderers import JSONRenderer
+
+from api.cache import (FRAGMENT_TIMEOUT, RECIPE_CACHE_TIMEOUT,
+                       USER_SPECIFIC_PARAMS, get_fragment_key,
+                       get_query_hash, get_user_flags, get_version)
+from api.middleware import record_serialization
+from api.serializers import RecipeReadSerializer, UserSerializer
+from recipes.models import Recipe
+from recipes.renditions import get_rendition
+from users.models import User
+
+PLACEHOLDER_PATTERN = re.compile(rb'"\\u0000(\w+)"')
+JSON_BOOLEANS = {True: b'true', False: b'false'}
+IMAGE_FIELDS = ('image_card', 'image_detail')
+
+
+def placeholder(name):
+    # Control characters are always escaped by the JSON encoder, so the
+    # placeholder cannot clash with real data.
+    return f'\x00{name}'
+
+
+def encode_fragment(data):
+    parts = PLACEHOLDER_PATTERN.split(JSONRenderer().render(data))
+    return tuple(
+        part.decode() if index % 2 else part
+        for index, part in enumerate(parts)
+    )
+
+
+def splice(parts, values):
+    return b''.join(
+        values[part] if index % 2 else part
+        for index, part in enumerate(parts)
+    )
+
+
+class AuthorFragmentSerializer(UserSerializer):
+    def get_is_subscribed(self, obj):
+        return placeholder('is_subscribed')
+
+
+class RecipeFragmentSerializer(RecipeReadSerializer):
+    author = SerializerMethodField()
+
+    def get_author(self, obj):
+        return placeholder('author')
+
+    def get_image(self, obj):
+        return placeholder('image')
+
+    def get_is_favorited(self, obj):
+        return placeholder('is_favorited')
+
+    def get_is_in_shopping_cart(self, obj):
+        return placeholder('is_in_shopping_cart')
+
+
+def get_image_paths(recipe):
+    if not recipe.image:
+        return (None, None)
+    return tuple(
+        (get_rendition(recipe, field) or recipe.image).url
+        for field in IMAGE_FIELDS
+    )
+
+
+def build_recipe_fragments(ids):
+    recipes = Recipe.objects.filter(id__in=ids).prefetch_related(
+        'amount_ingredients__ingredient', 'tags'
+    )
+    return {
+        recipe.id: {
+            'parts': encode_fragment(RecipeFragmentSerializer(recipe).data),
+            'images': get_image_paths(recipe),
+        }
+        for recipe in recipes
+    }
+
+
+def build_author_fragments(ids):
+    return {
+        author.id: encode_fragment(AuthorFragmentSerializer(author).data)
+        for author in User.objects.filter(id__in=ids)
+    }
+
+
+FRAGMENT_BUILDERS = {
+    'recipe': build_recipe_fragments,
+    'author': build_author_fragments,
+}
+
+
+def get_fragments(items):
+    generation = get_version('fragments')
+    keys = {}
+    for recipe_id, author_id in items:
+        keys[get_fragment_key(generation, 'recipe', recipe_id)] = (
+            'recipe', recipe_id
+        )
+        keys[get_fragment_key(generation, 'author', author_id)] = (
+            'author', author_id
+        )
+    fragments = {
+        keys[key]: fragment for key, fragment in cache.get_many(keys).items()
+    }
+    missing = {}
+    for kind, pk in keys.values():
+        if (kind, pk) not in fragments:
+            missing.setdefault(kind, []).append(pk)
+    built = {}
+    for kind, ids in missing.items():
+        for pk, fragment in FRAGMENT_BUILDERS[kind](ids).items():
+            fragments[kind, pk] = fragment
+            built[get_fragment_key(generation, kind, pk)] = fragment
+    if built:
+        cache.set_many(built, FRAGMENT_TIMEOUT)
+    return fragments
+
+
+def refresh_recipe_fragments(ids):
+    generation = get_version('fragments')
+    fragments = build_recipe_fragments(ids)
+    cache.set_many({
+        get_fragment_key(generation, 'recipe', pk): fragment
+        for pk, fragment in fragments.items()
+    }, FRAGMENT_TIMEOUT)
+    cache.delete_many([
+        get_fragment_key(generation, 'recipe', pk)
+        for pk in set(ids) - fragments.keys()
+    ])
+
+
+def render_recipes(page, fragments, flags, request, detail):
+    recipes = []
+    for recipe_id, author_id in page['items']:
+        recipe = fragments.get(('recipe', recipe_id))
+        author = fragments.get(('author', author_id))
+        if recipe is None or author is None:
+            continue
+        image = recipe['images'][detail]
+        if image is not None:
+            image = request.build_absolute_uri(image)
+        recipes.append(splice(recipe['parts'], {
+            'author': splice(author, {
+                'is_subscribed':
+                    JSON_BOOLEANS[author_id in flags['subscriptions']],
+            }),
+            'image': json.dumps(image).encode(),
+            'is_favorited': JSON_BOOLEANS[recipe_id in flags['favorites']],
+            'is_in_shopping_cart': JSON_BOOLEANS[recipe_id in flags['cart']],
+        }))
+    if page['parts'] is None:
+        return recipes[0]
+    return splice(page['parts'], {'results': b'[' + b','.join(recipes) + b']'})
+
+
+def get_page(data, recipes):
+    return {
+        'parts': encode_fragment({**data, 'results': placeholder('results')}),
+        'items': [(recipe.id, recipe.author_id) for recipe in recipes],
+    }
+
+
+class FragmentResponse(HttpResponse):
+    """Recipe payload spliced from fragments once user flags are known."""
+
+    def __init__(self, page, request, detail=False):
+        super().__init__(content_type='application/json')
+        self.page = page
+        self.fragments = get_fragments(page['items'])
+        if detail and ('recipe', page['items'][0][0]) not in self.fragments:
+            raise Http404
+        self.fragment_request = request
+        self.detail = detail
+        self.user_flags_pending = True
+
+    def render_flags(self, flags):
+        with record_serialization():
+            self.content = render_recipes(
+                self.page, self.fragments, flags,
+                self.fragment_request, self.detail
+            )
+        self.user_flags_pending = False
+
+
+class RecipeCacheMixin:
+    """Serves recipe list and detail pages from pre-encoded fragments.
+
+    The page cache keeps only the page skeleton: pagination links and
+    the (recipe id, author id) pairs of the results. Favorited/cart/
+    subscribed flags come from a small per-user cache invalidated by
+    signals. Async views set request.defer_user_flags and render the
+    flags themselves, see api.async_views.
+    """
+
+    @classmethod
+    def is_cacheable(cls, request):
+        # Search results carry a per-query snippet, so they are rendered
+        # by the serializer. Takes Django and DRF requests alike.
+        return not request.GET.get('search') and not any(
+            request.GET.get(param) not in (None, '', '0', 'false')
+            for param in USER_SPECIFIC_PARAMS
+        )
+
+    def get_page_queryset(self):
+        return self.filter_queryset(self.get_queryset()).select_related(
+            None
+        ).prefetch_related(None)
+
+    def get_fragment_response(self, request, page, detail=False):
+        response = FragmentResponse(page, request, detail)
+        if not getattr(request, 'defer_user_flags', False):
+            response.render_flags(get_user_flags(request.user))
+        return response
+
+    def get_cached_response(self, view, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return view(request, *args, **kwargs)
+        key = 'recipes:{}:{}:{}:{}'.format(
+            get_version('recipes'),
+            request.get_host(),
+            request.path,
+            get_query_hash(request)
+        )
+        page = cache.get(key)
+        if page is None:
+            if self.action == 'retrieve':
+                recipe = get_object_or_404(
+                    self.get_page_queryset(),
+                    pk=kwargs[self.lookup_url_kwarg or self.lookup_field]
+                )
+                self.check_object_permissions(request, recipe)
+                page = {
+                    'parts': None,
+                    'items': [(recipe.id, recipe.author_id)],
+                }
+            else:
+                recipes = self.paginate_queryset(self.get_page_queryset())
+                page = get_page(
+                    self.get_paginated_response([]).data, recipes
+                )
+            cache.set(key, page, RECIPE_CACHE_TIMEOUT)
+        return self.get_fragment_response(
+            request, page, detail=self.action == 'retrieve'
+        )
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
@@ -0,0 +1,51 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.autocomplete import IngredientIndex
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает автодополнение ингредиентов через ORM и через индекс'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def measure(self, search, queries):
+        started = time.perf_counter()
+        for query in queries:
+            list(search(query))
+        return (time.perf_counter() - started) / len(queries) * 1000
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            self.stderr.write('В базе нет ингредиентов')
+            return
+        rnd = random.Random(options['seed'])
+        queries = [
+            rnd.choice(names)[:rnd.randint(1, 4)]
+            for _ in range(options['queries'])
+        ]
+        index = IngredientIndex()
+        index.search('')
+
+        orm_ms = self.measure(
+            lambda query: Ingredient.objects.filter(
+                name__istartswith=query
+            ),
+            queries
+        )
+        index_ms = self.measure(index.search, queries)
+
+        self.stdout.write(
+            f'Ингредиентов: {len(names)}, запросов: {len(queries)}'
+        )
+        self.stdout.write(f'ORM istartswith: {orm_ms:.3f} мс/запрос')
+        self.stdout.write(f'Индекс: {index_ms:.3f} мс/запрос')
+        self.stdout.write(self.style.SUCCESS(
+            f'Ускорение: {orm_ms / index_ms:.1f}x'
+        ))
@@ -0,0 +1,87 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Value
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from api.cache import USER_FLAG_QUERIES
+from api.fragments import get_fragments, get_page, render_recipes
+from api.serializers import RecipeReadSerializer
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает процессорное время сериализатора рецептов '
+            'и сборки ответа из готовых JSON-фрагментов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=50)
+        parser.add_argument('--page-size', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def measure(self, render, pages, repeat):
+        started = time.process_time()
+        for _ in range(repeat):
+            for page in pages:
+                render(page)
+        return (time.process_time() - started) / repeat / len(pages) * 1000
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        recipes = list(Recipe.objects.select_related(
+            'author'
+        ).prefetch_related(
+            'amount_ingredients__ingredient', 'tags'
+        ).annotate(
+            is_favorited=Value(False),
+            is_in_shopping_cart=Value(False)
+        )[:options['pages'] * page_size])
+        if not recipes:
+            raise CommandError('В базе нет рецептов')
+        pages = [
+            recipes[start:start + page_size]
+            for start in range(0, len(recipes), page_size)
+        ]
+        if 'testserver' not in settings.ALLOWED_HOSTS:
+            settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+        request = RequestFactory().get('/api/recipes/')
+        request.user = AnonymousUser()
+        flags = {name: set() for name in USER_FLAG_QUERIES}
+        skeletons = [
+            get_page({'count': len(recipes), 'next': None, 'previous': None},
+                     page)
+            for page in pages
+        ]
+        get_fragments([
+            item for skeleton in skeletons for item in skeleton['items']
+        ])
+
+        serializer_ms = self.measure(
+            lambda page: JSONRenderer().render(RecipeReadSerializer(
+                page, many=True, context={'request': request}
+            ).data),
+            pages, options['repeat']
+        )
+        fragments_ms = self.measure(
+            lambda skeleton: render_recipes(
+                skeleton, get_fragments(skeleton['items']), flags,
+                request, False
+            ),
+            skeletons, options['repeat']
+        )
+
+        ingredients = sum(
+            len(recipe.amount_ingredients.all()) for recipe in recipes
+        ) / len(recipes)
+        self.stdout.write(
+            f'Страниц: {len(pages)} по {page_size} рецептов, '
+            f'в среднем {ingredients:.1f} ингредиентов в рецепте'
+        )
+        self.stdout.write(f'Сериализатор: {serializer_ms:.3f} мс/страница')
+        self.stdout.write(f'Фрагменты: {fragments_ms:.3f} мс/страница')
+        self.stdout.write(self.style.SUCCESS(
+            f'Ускорение: {serializer_ms / fragments_ms:.1f}x'
+        ))
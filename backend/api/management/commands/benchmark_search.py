@@ -0,0 +1,60 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from recipes.models import Recipe
+from recipes.search import is_full_text_supported, search_recipes
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает полнотекстовый поиск рецептов с поиском через icontains'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def measure(self, search, queries, limit):
+        started = time.perf_counter()
+        for query in queries:
+            list(search(query).values_list('id', flat=True)[:limit])
+        return (time.perf_counter() - started) / len(queries) * 1000
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if not is_full_text_supported(recipes):
+            raise CommandError(
+                'Полнотекстовый поиск доступен только в PostgreSQL'
+            )
+        words = [
+            word for name in recipes.values_list('name', flat=True)[:1000]
+            for word in name.split() if len(word) > 3
+        ]
+        if not words:
+            raise CommandError('В базе нет рецептов')
+        rnd = random.Random(options['seed'])
+        queries = [rnd.choice(words) for _ in range(options['queries'])]
+
+        icontains_ms = self.measure(
+            lambda query: recipes.filter(
+                Q(name__icontains=query)
+                | Q(text__icontains=query)
+                | Q(ingredients__name__icontains=query)
+            ).distinct(),
+            queries, options['limit']
+        )
+        search_ms = self.measure(
+            lambda query: search_recipes(recipes, query),
+            queries, options['limit']
+        )
+
+        self.stdout.write(
+            f'Рецептов: {recipes.count()}, запросов: {len(queries)}'
+        )
+        self.stdout.write(f'icontains: {icontains_ms:.3f} мс/запрос')
+        self.stdout.write(f'Полнотекстовый поиск: {search_ms:.3f} мс/запрос')
+        self.stdout.write(self.style.SUCCESS(
+            f'Ускорение: {icontains_ms / search_ms:.1f}x'
+        ))
@@ -0,0 +1,132 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.utils import get_shopping_list
+from api.views import CustomUserViewSet, RecipeViewSet
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+from users.models import Subscription
+
+User = get_user_model()
+
+SEQ_SCAN = re.compile(
+    r'Seq Scan on (\w+).*actual time=\S+ rows=(\d+) loops=(\d+)'
+)
+ROWS_REMOVED = re.compile(r'Rows Removed by Filter: (\d+)')
+
+
+class Command(BaseCommand):
+    help = ('Выполняет EXPLAIN ANALYZE для основных запросов API и падает, '
+            'если в плане есть Seq Scan по большому числу строк')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold',
+            type=int,
+            default=1000,
+            help='Допустимое число строк, прочитанных одним Seq Scan'
+        )
+        parser.add_argument(
+            '--user',
+            help='email пользователя, от имени которого строятся запросы'
+        )
+
+    def get_view(self, viewset_class, action, user, query=None):
+        request = APIRequestFactory().get('/', query or {})
+        force_authenticate(request, user)
+        view = viewset_class(action_map={'get': action}, format_kwarg=None)
+        view.request = view.initialize_request(request)
+        return view
+
+    def get_recipes(self, user, query=None, action='list'):
+        view = self.get_view(RecipeViewSet, action, user, query)
+        return view.filter_queryset(view.get_queryset())
+
+    def get_queries(self, user):
+        recipe = Recipe.objects.order_by('?').first()
+        tag = Tag.objects.order_by('?').first()
+        subscriptions = self.get_view(
+            CustomUserViewSet, 'subscriptions', user, {'recipes_limit': 3}
+        )
+        queries = {
+            'recipes feed': self.get_recipes(user)[:6],
+            'recipes feed, author': self.get_recipes(
+                user, {'author': recipe.author_id}
+            )[:6],
+            'recipes feed, favorites': self.get_recipes(
+                user, {'is_favorited': 1}
+            )[:6],
+            'recipes feed, shopping cart': self.get_recipes(
+                user, {'is_in_shopping_cart': 1}
+            )[:6],
+            'recipe detail': self.get_recipes(
+                user, action='retrieve'
+            ).filter(pk=recipe.pk),
+            'recipe favorites': Favorite.objects.filter(recipe=recipe),
+            'recipe in carts': ShoppingCart.objects.filter(recipe=recipe),
+            'subscriptions': subscriptions.get_queryset()[:6],
+            'author followers': Subscription.objects.filter(
+                author=recipe.author
+            ),
+            'shopping list': get_shopping_list(user),
+        }
+        if tag is not None:
+            queries['recipes feed, tag'] = self.get_recipes(
+                user, {'tags': tag.slug}
+            )[:6]
+        return queries
+
+    def find_seq_scans(self, plan):
+        lines = plan.splitlines()
+        for number, line in enumerate(lines):
+            match = SEQ_SCAN.search(line)
+            if match is None:
+                continue
+            table, rows, loops = match.groups()
+            scanned = int(rows)
+            for detail in lines[number + 1:]:
+                if '->' in detail:
+                    break
+                removed = ROWS_REMOVED.search(detail)
+                if removed is not None:
+                    scanned += int(removed.group(1))
+            yield table, scanned * int(loops)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Команда работает только с PostgreSQL')
+        if not Recipe.objects.exists():
+            raise CommandError('В базе нет рецептов, сначала заполните её')
+        if options['user']:
+            user = User.objects.filter(email=options['user']).first()
+        else:
+            user = User.objects.filter(favorites__isnull=False).first()
+        if user is None:
+            raise CommandError('Не найден пользователь для запросов')
+
+        failures = []
+        for name, queryset in self.get_queries(user).items():
+            plan = queryset.explain(analyze=True)
+            scans = [
+                (table, rows) for table, rows in self.find_seq_scans(plan)
+                if rows > options['threshold']
+            ]
+            if scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'{name}: FAIL'))
+                for table, rows in scans:
+                    self.stdout.write(f'  Seq Scan on {table}: {rows} строк')
+                if options['verbosity'] > 1:
+                    self.stdout.write(plan)
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: OK'))
+
+        if failures:
+            raise CommandError(
+                'Seq Scan выше порога в запросах: {}'.format(
+                    ', '.join(failures)
+                )
+            )
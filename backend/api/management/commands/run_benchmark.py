@@ -0,0 +1,292 @@
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+SCENARIOS = {
+    'feed': 30,
+    'feed_tags': 15,
+    'feed_author': 5,
+    'recipe_detail': 15,
+    'autocomplete': 15,
+    'tags': 5,
+    'favorite': 5,
+    'subscriptions': 5,
+    'download_cart': 5,
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class LiveClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, token=None):
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        response = self.session.request(
+            method, self.base_url + path, headers=headers
+        )
+        return response.status_code
+
+
+class TestClient:
+    def __init__(self):
+        if 'testserver' not in settings.ALLOWED_HOSTS:
+            settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+        self.client = APIClient()
+
+    def request(self, method, path, token=None):
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        response = getattr(self.client, method.lower())(path, **headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет типовую нагрузку на API и считает задержки, RPS '
+            'и число SQL-запросов на запрос')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument(
+            '--anonymous',
+            type=float,
+            default=0.3,
+            help='Доля запросов без авторизации'
+        )
+        parser.add_argument(
+            '--url',
+            help='Адрес запущенного сервера; по умолчанию тестовый клиент'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help=('Число одновременных клиентов, только с --url; '
+                  'сравните WSGI и ASGI с API_ASYNC_VIEWS=True '
+                  'на одном воркере')
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Сохранить результат в JSON')
+        parser.add_argument(
+            '--baseline',
+            help='JSON предыдущего прогона для сравнения'
+        )
+
+    def prepare(self, options):
+        users = list(User.objects.order_by('?')[:options['users']])
+        recipes = list(Recipe.objects.values_list('id', 'author_id'))
+        tags = list(Tag.objects.values_list('slug', flat=True))
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not (users and recipes and tags and names):
+            raise CommandError(
+                'Нужны пользователи, рецепты, теги и ингредиенты: '
+                'запустите seed_database'
+            )
+        tokens = [
+            Token.objects.get_or_create(user=user)[0].key for user in users
+        ]
+        return tokens, recipes, tags, names
+
+    def get_requests(self, rnd, scenario, recipes, tags, names):
+        recipe_id, author_id = rnd.choice(recipes)
+        if scenario == 'feed':
+            return [('GET', f'/api/recipes/?page={rnd.randint(1, 5)}')]
+        if scenario == 'feed_tags':
+            query = '&'.join(
+                f'tags={tag}' for tag in rnd.sample(tags, min(2, len(tags)))
+            )
+            return [('GET', f'/api/recipes/?{query}')]
+        if scenario == 'feed_author':
+            return [('GET', f'/api/recipes/?author={author_id}')]
+        if scenario == 'recipe_detail':
+            return [('GET', f'/api/recipes/{recipe_id}/')]
+        if scenario == 'autocomplete':
+            name = rnd.choice(names)[:rnd.randint(1, 4)]
+            return [('GET', f'/api/ingredients/?name={name}')]
+        if scenario == 'tags':
+            return [('GET', '/api/tags/')]
+        if scenario == 'favorite':
+            return [
+                ('POST', f'/api/recipes/{recipe_id}/favorite/'),
+                ('DELETE', f'/api/recipes/{recipe_id}/favorite/'),
+            ]
+        if scenario == 'subscriptions':
+            return [('GET', '/api/users/subscriptions/?recipes_limit=3')]
+        return [('GET', '/api/recipes/download_shopping_cart/')]
+
+    def get_plan(self, options):
+        rnd = random.Random(options['seed'])
+        tokens, recipes, tags, names = self.prepare(options)
+        authenticated_only = ('favorite', 'subscriptions', 'download_cart')
+        plan = []
+        while len(plan) < options['requests']:
+            scenario = rnd.choices(
+                list(SCENARIOS), list(SCENARIOS.values())
+            )[0]
+            token = None
+            if (scenario in authenticated_only
+                    or rnd.random() >= options['anonymous']):
+                token = rnd.choice(tokens)
+            plan.append([
+                (scenario, method, path, token)
+                for method, path in self.get_requests(
+                    rnd, scenario, recipes, tags, names
+                )
+            ])
+        return plan
+
+    def run(self, client, options):
+        plan = self.get_plan(options)
+        latencies = defaultdict(list)
+        queries = defaultdict(list)
+        errors = defaultdict(int)
+        started = time.perf_counter()
+        for steps in plan:
+            for scenario, method, path, token in steps:
+                with CaptureQueriesContext(connection) as context:
+                    request_started = time.perf_counter()
+                    status_code = client.request(method, path, token)
+                    elapsed = time.perf_counter() - request_started
+                latencies[scenario].append(elapsed * 1000)
+                if options['url'] is None:
+                    queries[scenario].append(len(context.captured_queries))
+                if status_code >= 400:
+                    errors[scenario] += 1
+        duration = time.perf_counter() - started
+        count = sum(len(steps) for steps in plan)
+        return self.summarize(latencies, queries, errors, count, duration)
+
+    def run_concurrent(self, options):
+        plan = self.get_plan(options)
+        local = threading.local()
+        lock = threading.Lock()
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+
+        def run_steps(steps):
+            if not hasattr(local, 'client'):
+                local.client = LiveClient(options['url'])
+            for scenario, method, path, token in steps:
+                request_started = time.perf_counter()
+                status_code = local.client.request(method, path, token)
+                elapsed = time.perf_counter() - request_started
+                with lock:
+                    latencies[scenario].append(elapsed * 1000)
+                    if status_code >= 400:
+                        errors[scenario] += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            list(pool.map(run_steps, plan))
+        duration = time.perf_counter() - started
+        count = sum(len(steps) for steps in plan)
+        return self.summarize(
+            latencies, defaultdict(list), errors, count, duration
+        )
+
+    def summarize(self, latencies, queries, errors, count, duration):
+        def stats(values, query_counts, error_count):
+            return {
+                'requests': len(values),
+                'errors': error_count,
+                'p50': round(percentile(values, 0.50), 3),
+                'p95': round(percentile(values, 0.95), 3),
+                'p99': round(percentile(values, 0.99), 3),
+                'queries': (
+                    round(sum(query_counts) / len(query_counts), 2)
+                    if query_counts else None
+                ),
+            }
+
+        all_latencies = [value for values in latencies.values()
+                         for value in values]
+        all_queries = [value for values in queries.values()
+                       for value in values]
+        total = stats(all_latencies, all_queries, sum(errors.values()))
+        total['rps'] = round(count / duration, 2)
+        return {
+            'total': total,
+            'scenarios': {
+                scenario: stats(values, queries[scenario], errors[scenario])
+                for scenario, values in sorted(latencies.items())
+            },
+        }
+
+    def format_change(self, current, previous):
+        if not previous:
+            return ''
+        change = (current - previous) / previous * 100
+        return f' ({change:+.1f}%)'
+
+    def report(self, result, baseline):
+        baseline_scenarios = dict(baseline.get('scenarios', {}))
+        baseline_scenarios['total'] = baseline.get('total', {})
+        rows = [('total', result['total'])] + list(
+            result['scenarios'].items()
+        )
+        for name, stats in rows:
+            previous = baseline_scenarios.get(name, {})
+            line = f'{name:<15} n={stats["requests"]:<6}'
+            for key in ('p50', 'p95', 'p99'):
+                line += f' {key}={stats[key]:.1f}ms' + self.format_change(
+                    stats[key], previous.get(key)
+                )
+            if stats['queries'] is not None:
+                line += f' queries={stats["queries"]}' + self.format_change(
+                    stats['queries'], previous.get('queries')
+                )
+            if stats['errors']:
+                line += f' errors={stats["errors"]}'
+            self.stdout.write(line)
+        self.stdout.write(
+            f'RPS: {result["total"]["rps"]}' + self.format_change(
+                result['total']['rps'],
+                baseline.get('total', {}).get('rps')
+            )
+        )
+
+    def handle(self, *args, **options):
+        baseline = {}
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+        if options['concurrency'] > 1:
+            if not options['url']:
+                raise CommandError('--concurrency работает только с --url')
+            result = self.run_concurrent(options)
+        else:
+            client = (LiveClient(options['url']) if options['url']
+                      else TestClient())
+            result = self.run(client, options)
+        self.report(result, baseline)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Результат сохранён в {options["output"]}'
+            ))
@@ -0,0 +1,216 @@
+import io
+import random
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from recipes.models import (Favorite, Ingredient, IngredientRecipes, Recipe,
+                            ShoppingCart, Tag)
+from recipes.search import is_full_text_supported
+from users.models import Subscription
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+SEED_PASSWORD = 'seed-password'
+TAG_NAMES = (
+    'Завтрак', 'Обед', 'Ужин', 'Десерт', 'Выпечка', 'Салат', 'Суп',
+    'Напиток', 'Закуска', 'Вегетарианское',
+)
+
+
+def zipf_weights(size, exponent):
+    return [1 / (rank ** exponent) for rank in range(1, size + 1)]
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу пользователями, рецептами, избранным, '
+            'корзинами и подписками с неравномерным распределением')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--favorites', type=int, default=20000)
+        parser.add_argument('--carts', type=int, default=5000)
+        parser.add_argument('--subscriptions', type=int, default=3000)
+        parser.add_argument('--tags', type=int, default=len(TAG_NAMES))
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.1,
+            help='Показатель распределения Ципфа для авторов и рецептов'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def create_users(self, count):
+        first_id = User.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        password = make_password(SEED_PASSWORD)
+        start = User.objects.filter(username__startswith='seed-').count()
+        User.objects.bulk_create(
+            (
+                User(
+                    email=f'seed-{number}@example.com',
+                    username=f'seed-{number}',
+                    first_name=f'Имя{number}',
+                    last_name=f'Фамилия{number}',
+                    password=password,
+                )
+                for number in range(start, start + count)
+            ),
+            batch_size=BATCH_SIZE
+        )
+        return list(User.objects.filter(id__gt=first_id).values_list(
+            'id', flat=True
+        ))
+
+    def create_tags(self, count):
+        tags = list(Tag.objects.values_list('id', flat=True))
+        for number in range(len(tags), count):
+            name = (TAG_NAMES[number] if number < len(TAG_NAMES)
+                    else f'Тег {number}')
+            tags.append(Tag.objects.create(
+                name=name,
+                color='#{:06x}'.format(number * 0x1f3d5b % 0xffffff),
+                slug=f'seed-tag-{number}'
+            ).id)
+        return tags
+
+    def create_image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (400, 300), '#e26c2d').save(buffer, 'JPEG')
+        return default_storage.save(
+            'recipes/images/seed.jpg', ContentFile(buffer.getvalue())
+        )
+
+    def create_recipes(self, count, authors, tags, ingredients, rnd, skew):
+        first_id = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        image = self.create_image()
+        author_weights = zipf_weights(len(authors), skew)
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=author,
+                    name=f'Рецепт {first_id + number}',
+                    image=image,
+                    text='Описание рецепта ' * rnd.randint(5, 40),
+                    cooking_time=rnd.randint(5, 180),
+                )
+                for number, author in enumerate(rnd.choices(
+                    authors, author_weights, k=count
+                ), start=1)
+            ),
+            batch_size=BATCH_SIZE
+        )
+        recipes = list(Recipe.objects.filter(id__gt=first_id).order_by('id'))
+
+        now = timezone.now()
+        for recipe in recipes:
+            recipe.pub_date = now - timedelta(
+                minutes=rnd.randint(0, 60 * 24 * 365)
+            )
+        Recipe.objects.bulk_update(recipes, ['pub_date'], batch_size=500)
+
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe_id=recipe.id, tag_id=tag)
+                for recipe in recipes
+                for tag in rnd.sample(tags, rnd.randint(1, min(3, len(tags))))
+            ),
+            batch_size=BATCH_SIZE
+        )
+        IngredientRecipes.objects.bulk_create(
+            (
+                IngredientRecipes(
+                    recipe_id=recipe.id,
+                    ingredient_id=ingredient,
+                    amount=rnd.randint(1, 500)
+                )
+                for recipe in recipes
+                for ingredient in rnd.sample(
+                    ingredients, min(rnd.randint(3, 15), len(ingredients))
+                )
+            ),
+            batch_size=BATCH_SIZE
+        )
+        return [recipe.id for recipe in recipes]
+
+    def create_pairs(self, model, field, count, users, targets, rnd, skew):
+        weights = zipf_weights(len(targets), skew)
+        pairs = set()
+        for _ in range(count * 3):
+            if len(pairs) >= count:
+                break
+            user = rnd.choice(users)
+            target = rnd.choices(targets, weights)[0]
+            if field == 'author_id' and user == target:
+                continue
+            pairs.add((user, target))
+        objects = [model(user_id=user, **{field: target})
+                   for user, target in pairs]
+        if field == 'recipe_id':
+            now = timezone.now()
+            for obj in objects:
+                obj.added_at = now - timedelta(
+                    minutes=rnd.randint(0, 60 * 24 * 14)
+                )
+        model.objects.bulk_create(
+            objects,
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True
+        )
+        return len(pairs)
+
+    def handle(self, *args, **options):
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredients:
+            raise CommandError(
+                'В базе нет ингредиентов, сначала импортируйте их'
+            )
+        rnd = random.Random(options['seed'])
+        skew = options['skew']
+
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            if not users:
+                raise CommandError('Нужен хотя бы один пользователь')
+            tags = self.create_tags(options['tags'])
+            recipes = self.create_recipes(
+                options['recipes'], users, tags, ingredients, rnd, skew
+            )
+            popular_recipes = rnd.sample(recipes, len(recipes))
+            popular_authors = rnd.sample(users, len(users))
+            favorites = self.create_pairs(
+                Favorite, 'recipe_id', options['favorites'],
+                users, popular_recipes, rnd, skew
+            )
+            carts = self.create_pairs(
+                ShoppingCart, 'recipe_id', options['carts'],
+                users, popular_recipes, rnd, skew
+            )
+            subscriptions = self.create_pairs(
+                Subscription, 'author_id', options['subscriptions'],
+                users, popular_authors, rnd, skew
+            )
+        call_command('repair_counters', stdout=self.stdout)
+        call_command('rebuild_feeds', stdout=self.stdout)
+        if is_full_text_supported(Recipe.objects.all()):
+            call_command('update_search_vectors', stdout=self.stdout)
+        call_command('compute_trending', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: пользователей {len(users)}, рецептов {len(recipes)}, '
+            f'избранного {favorites}, корзин {carts}, '
+            f'подписок {subscriptions}. Пароль пользователей: {SEED_PASSWORD}'
+        ))
@@ -0,0 +1,101 @@
+import threading
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+METRICS = {
+    'api_request_duration_ms': (
+        'histogram', 'Время обработки запроса, мс', LATENCY_BUCKETS
+    ),
+    'api_request_db_duration_ms': (
+        'histogram', 'Время SQL-запросов за запрос, мс', LATENCY_BUCKETS
+    ),
+    'api_request_serialize_duration_ms': (
+        'histogram', 'Время сериализации и рендеринга ответа, мс',
+        LATENCY_BUCKETS
+    ),
+    'api_request_queries': (
+        'histogram', 'Число SQL-запросов за запрос', QUERY_BUCKETS
+    ),
+    'api_request_duplicate_queries_total': (
+        'counter', 'Повторяющиеся SQL-запросы (признак N+1)', None
+    ),
+    'api_token_cache_requests_total': (
+        'counter', 'Обращения к кешу токенов (result=hit|miss)', None
+    ),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.values = {name: {} for name in metrics}
+        self.lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.values[name]
+            if key not in series:
+                series[key] = Histogram(self.metrics[name][2])
+            series[key].observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.values[name]
+            series[key] = series.get(key, 0) + value
+
+    def format_labels(self, labels, **extra):
+        labels = list(labels) + list(extra.items())
+        if not labels:
+            return ''
+        return '{%s}' % ','.join(
+            '{}="{}"'.format(name, str(value).replace('"', '\\"'))
+            for name, value in labels
+        )
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (kind, help_text, _) in self.metrics.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in sorted(self.values[name].items()):
+                    if kind == 'histogram':
+                        lines.extend(self.render_histogram(
+                            name, labels, value
+                        ))
+                    else:
+                        lines.append(
+                            f'{name}{self.format_labels(labels)} {value}'
+                        )
+        return '\n'.join(lines) + '\n'
+
+    def render_histogram(self, name, labels, histogram):
+        cumulative = 0
+        bounds = [str(bound) for bound in histogram.buckets] + ['+Inf']
+        for bound, count in zip(bounds, histogram.counts):
+            cumulative += count
+            yield '{}_bucket{} {}'.format(
+                name, self.format_labels(labels, le=bound), cumulative
+            )
+        yield f'{name}_sum{self.format_labels(labels)} {histogram.sum}'
+        yield f'{name}_count{self.format_labels(labels)} {histogram.count}'
+
+
+registry = Registry(METRICS)
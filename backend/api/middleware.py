@@ -0,0 +1,182 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from api.metrics import registry
+
+logger = logging.getLogger('api.instrumentation')
+
+current_recorder = ContextVar('current_recorder', default=None)
+serializing = ContextVar('serializing', default=False)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.statements = Counter()
+        self.duration = 0
+        self.serialize_duration = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self.lock:
+                self.duration += time.perf_counter() - started
+                self.statements[sql] += 1
+
+    @property
+    def count(self):
+        return sum(self.statements.values())
+
+    @property
+    def duplicates(self):
+        return {
+            sql: count for sql, count in self.statements.items() if count > 1
+        }
+
+
+def record_queries():
+    """Record queries of the current thread for the request being served.
+
+    Async views run their queries in pool threads, whose connections are
+    not wrapped by the middleware, see api.async_views.
+    """
+    recorder = current_recorder.get()
+    if recorder is None:
+        return nullcontext()
+    return connection.execute_wrapper(recorder)
+
+
+@contextmanager
+def record_serialization():
+    """Add the time of the block to the serializer time of the request.
+
+    Nested blocks, such as nested serializers or a renderer calling a
+    serializer, are counted once by the outermost one.
+    """
+    recorder = current_recorder.get()
+    if recorder is None or serializing.get():
+        yield
+        return
+    token = serializing.set(True)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        serializing.reset(token)
+        with recorder.lock:
+            recorder.serialize_duration += time.perf_counter() - started
+
+
+class InstrumentationMiddleware:
+    """Records SQL and timing per API request.
+
+    Emits Server-Timing headers, a JSON log line and histograms for
+    /api/metrics/. Enabled with API_INSTRUMENTATION=True. Streaming
+    responses run most of their queries while the body is sent, so they
+    are recorded once the body is exhausted and get no Server-Timing.
+    """
+
+    def __init__(self, get_response):
+        if not settings.API_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith('/api/'):
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        token = current_recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(recorder):
+                response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        if response.streaming:
+            response.streaming_content = self.record_streaming(
+                response.streaming_content,
+                request, response, recorder, started
+            )
+            return response
+        timing = self.record(request, response, recorder, started)
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={timing["db_ms"]:.2f};'
+            f'desc="{recorder.count} queries"',
+            f'serialize;dur={timing["serialize_ms"]:.2f};'
+            f'desc="serialization and rendering"',
+            f'app;dur={timing["non_db_ms"]:.2f};desc="non-DB"',
+            f'dup;desc="{timing["duplicate_queries"]} duplicate queries"',
+            f'total;dur={timing["total_ms"]:.2f}',
+        ))
+        return response
+
+    def record_streaming(self, content, request, response, recorder,
+                         started):
+        try:
+            with connection.execute_wrapper(recorder):
+                yield from content
+        finally:
+            self.record(request, response, recorder, started)
+
+    def record(self, request, response, recorder, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        db_ms = recorder.duration * 1000
+        # Queries of async views may overlap, so their summed time can
+        # exceed the wall time of the request.
+        non_db_ms = max(total_ms - db_ms, 0)
+        serialize_ms = recorder.serialize_duration * 1000
+        duplicates = recorder.duplicates
+        duplicate_count = sum(duplicates.values()) - len(duplicates)
+
+        match = request.resolver_match
+        endpoint = match.view_name if match is not None else 'unknown'
+        labels = {'endpoint': endpoint, 'method': request.method}
+        registry.observe('api_request_duration_ms', total_ms, **labels)
+        registry.observe('api_request_db_duration_ms', db_ms, **labels)
+        registry.observe(
+            'api_request_serialize_duration_ms', serialize_ms, **labels
+        )
+        registry.observe('api_request_queries', recorder.count, **labels)
+        if duplicate_count:
+            registry.inc(
+                'api_request_duplicate_queries_total',
+                duplicate_count,
+                **labels
+            )
+
+        timing = {
+            'total_ms': total_ms,
+            'db_ms': db_ms,
+            'non_db_ms': non_db_ms,
+            'serialize_ms': serialize_ms,
+            'duplicate_queries': duplicate_count,
+        }
+        log = logger.warning if duplicate_count else logger.info
+        log(json.dumps({
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'total_ms': round(total_ms, 2),
+            'db_ms': round(db_ms, 2),
+            'non_db_ms': round(non_db_ms, 2),
+            'serialize_ms': round(serialize_ms, 2),
+            'queries': recorder.count,
+            'duplicate_queries': duplicate_count,
+            'duplicated_sql': sorted(
+                duplicates, key=duplicates.get, reverse=True
+            )[:3],
+            'streaming': response.streaming,
+        }, ensure_ascii=False))
+        return timing
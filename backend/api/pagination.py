@@ -0,0 +1,131 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Forward-only cursor pagination over descending fields.
+
+    The cursor holds the values of the last row, so each page is an
+    index range scan instead of COUNT(*) plus a growing OFFSET.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор'
+
+    def __init__(self, ordering):
+        self.ordering = ordering
+        self.fields = [field.lstrip('-') for field in ordering]
+
+    def get_page_size(self, request):
+        page_size = request.query_params.get(self.page_size_query_param, '')
+        if page_size.isdigit() and int(page_size) > 0:
+            return min(int(page_size), self.max_page_size)
+        return api_settings.PAGE_SIZE
+
+    def encode_cursor(self, obj):
+        position = [getattr(obj, field) for field in self.fields]
+        return base64.urlsafe_b64encode(
+            json.dumps(position, default=str).encode()
+        ).decode()
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list)
+                or len(position) != len(self.fields)):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_field(self, queryset, name):
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    def convert_position(self, queryset, position):
+        # Values come from the client, so bad ones must not reach the
+        # query as database errors.
+        try:
+            values = [
+                self.get_field(queryset, field).to_python(value)
+                for field, value in zip(self.fields, position)
+            ]
+        except (ValidationError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            position = self.convert_position(queryset, position)
+            after = Q()
+            for index, field in enumerate(self.fields):
+                after |= Q(
+                    **dict(zip(self.fields[:index], position[:index])),
+                    **{f'{field}__lt': position[index]}
+                )
+            queryset = queryset.filter(after)
+        results = list(queryset[:page_size + 1])
+        self.next_cursor = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            self.next_cursor = self.encode_cursor(results[-1])
+        return results
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class PageNumberOrKeysetPagination(PageNumberPagination):
+    """Page numbers by default, keyset pagination when ?cursor= is passed.
+
+    The view opts in by defining keyset_ordering.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'keyset_ordering', None)
+        self.keyset = None
+        if (ordering is not None
+                and KeysetPagination.cursor_query_param
+                in request.query_params):
+            self.keyset = KeysetPagination(ordering)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
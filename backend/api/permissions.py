@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework.permissions import SAFE_METHODS, BasePermission
 
 
@@ -7,3 +8,13 @@ class IsOwnerOrReadOnly(BasePermission):
         if request.method in SAFE_METHODS:
             return True
         return obj.author == request.user
+
+
+class IsStaffOrAllowedIP(BasePermission):
+
+    def has_permission(self, request, view):
+        return (
+            request.user.is_staff
+            or request.META.get('REMOTE_ADDR')
+            in settings.API_METRICS_ALLOWED_IPS
+        )
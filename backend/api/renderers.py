@@ -0,0 +1,11 @@
+from rest_framework.renderers import JSONRenderer
+
+from api.middleware import record_serialization
+
+
+class RecordSerializationJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with record_serialization():
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
@@ -1,19 +1,50 @@
 
+import json
+import os
+import uuid
+
 from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+from django.http import QueryDict
 from djoser.serializers import UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
+from rest_framework.exceptions import NotFound
 from rest_framework.fields import SerializerMethodField
-from rest_framework.validators import UniqueTogetherValidator
 
+from api.middleware import record_serialization
+from api.utils import get_recipes_limit
 from recipes.models import (Favorite, Ingredient, IngredientRecipes, Recipe,
                             ShoppingCart, Tag)
+from recipes.renditions import get_rendition
 from users.models import Subscription
 
 User = get_user_model()
 
+IMAGE_TOKEN_PREFIX = 'upload:'
+IMAGE_TOKEN_SALT = 'api.recipe-image-upload'
+IMAGE_TOKEN_MAX_AGE = 60 * 60 * 24
+
+
+def get_image_url(context, image):
+    if not image:
+        return None
+    request = context.get('request')
+    if request is None:
+        return image.url
+    return request.build_absolute_uri(image.url)
+
+
+class RecordSerializationMixin:
+    def to_representation(self, instance):
+        with record_serialization():
+            return super().to_representation(instance)
+
 
-class UserSerializer(UserSerializer):
+class UserSerializer(RecordSerializationMixin, UserSerializer):
     is_subscribed = SerializerMethodField()
 
     class Meta:
@@ -24,20 +55,29 @@ class UserSerializer(UserSerializer):
             'username',
             'first_name',
             'last_name',
-            'is_subscribed'
+            'is_subscribed',
+            'recipes_count',
+            'followers_count',
         )
 
     def get_is_subscribed(self, obj):
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
         user = self.context.get('request').user
         if user is None or user.is_anonymous:
             return False
-        return Subscription.objects.filter(
-            user=user,
-            author=obj
-        ).exists()
+        if 'subscriptions' not in self.context:
+            self.context['subscriptions'] = set(
+                Subscription.objects.filter(
+                    user=user
+                ).values_list('author_id', flat=True)
+            )
+        return obj.id in self.context['subscriptions']
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(RecordSerializationMixin,
+                           serializers.ModelSerializer):
     id = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
@@ -77,7 +117,8 @@ class IngredientRecipeWriteSerializer(serializers.ModelSerializer):
         )
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(RecordSerializationMixin,
+                    serializers.ModelSerializer):
     id = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
@@ -90,10 +131,11 @@ class TagSerializer(serializers.ModelSerializer):
         )
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(RecordSerializationMixin,
+                           serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(read_only=True)
-    image = Base64ImageField(read_only=True)
+    image = SerializerMethodField(read_only=True)
     ingredients = IngredientRecipeReadSerializer(
         many=True, source='amount_ingredients'
     )
@@ -113,18 +155,90 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'image',
             'text',
             'cooking_time',
+            'favorites_count',
+        )
+
+    def get_image(self, obj):
+        view = self.context.get('view')
+        if view is not None and view.action == 'retrieve':
+            return get_image_url(
+                self.context,
+                get_rendition(obj, 'image_detail') or obj.image
+            )
+        return get_image_url(
+            self.context,
+            get_rendition(obj, 'image_card') or obj.image
         )
 
     def get_is_favorited(self, obj):
+        is_favorited = getattr(obj, 'is_favorited', None)
+        if is_favorited is not None:
+            return is_favorited
         user = self.context.get('request').user
         return (user.is_authenticated
                 and user.favorites.filter(recipe=obj).exists())
 
     def get_is_in_shopping_cart(self, obj):
+        is_in_shopping_cart = getattr(obj, 'is_in_shopping_cart', None)
+        if is_in_shopping_cart is not None:
+            return is_in_shopping_cart
         user = self.context.get('request').user
         return (user.is_authenticated
                 and user.cart.filter(recipe=obj).exists())
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        search_snippet = getattr(instance, 'search_snippet', None)
+        if search_snippet is not None:
+            data['search_snippet'] = search_snippet
+        return data
+
+
+class RecipeImageField(Base64ImageField):
+    default_error_messages = {
+        'invalid_token': 'Недействительный токен загруженного изображения',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            return serializers.ImageField.to_internal_value(self, data)
+        if isinstance(data, str) and data.startswith(IMAGE_TOKEN_PREFIX):
+            return self.load_token(data[len(IMAGE_TOKEN_PREFIX):])
+        return super().to_internal_value(data)
+
+    def load_token(self, token):
+        try:
+            upload = signing.loads(
+                token, salt=IMAGE_TOKEN_SALT, max_age=IMAGE_TOKEN_MAX_AGE
+            )
+        except signing.BadSignature:
+            self.fail('invalid_token')
+        user = self.context['request'].user
+        if (upload['user'] != user.id
+                or not default_storage.exists(upload['name'])):
+            self.fail('invalid_token')
+        return upload['name']
+
+
+class RecipeImageUploadSerializer(serializers.Serializer):
+    image = serializers.ImageField(write_only=True)
+    token = serializers.CharField(read_only=True)
+
+    def create(self, validated_data):
+        image = validated_data['image']
+        name = default_storage.save(
+            'recipes/images/{}{}'.format(
+                uuid.uuid4(), os.path.splitext(image.name)[1].lower()
+            ),
+            image
+        )
+        return {
+            'token': IMAGE_TOKEN_PREFIX + signing.dumps(
+                {'name': name, 'user': self.context['request'].user.id},
+                salt=IMAGE_TOKEN_SALT
+            )
+        }
+
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     tags = serializers.PrimaryKeyRelatedField(
@@ -133,7 +247,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     )
     author = UserSerializer(read_only=True)
     ingredients = IngredientRecipeWriteSerializer(many=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
 
     class Meta:
         model = Recipe
@@ -148,32 +262,96 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    def to_internal_value(self, data):
+        if isinstance(data, QueryDict):
+            multipart = data
+            data = multipart.dict()
+            if 'tags' in multipart:
+                data['tags'] = multipart.getlist('tags')
+            if 'ingredients' in multipart:
+                try:
+                    data['ingredients'] = json.loads(multipart['ingredients'])
+                except ValueError:
+                    raise serializers.ValidationError({
+                        'ingredients': 'Ожидался JSON-список ингредиентов'
+                    })
+        return super().to_internal_value(data)
+
+    def validate_ingredients(self, ingredients):
+        ingredient_ids = [ingredient['id'] for ingredient in ingredients]
+        if len(ingredient_ids) != len(set(ingredient_ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты в рецепте не должны повторяться'
+            )
+        existing = Ingredient.objects.in_bulk(ingredient_ids)
+        missing_ids = set(ingredient_ids) - existing.keys()
+        if missing_ids:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: {}'.format(
+                    ', '.join(str(id) for id in sorted(missing_ids))
+                )
+            )
+        return ingredients
+
     def create_ingredients(self, ingredients, recipe):
-        for ingredient in ingredients:
-            ingredients, status = IngredientRecipes.objects.get_or_create(
+        IngredientRecipes.objects.bulk_create(
+            IngredientRecipes(
                 recipe=recipe,
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
+                ingredient_id=ingredient['id'],
                 amount=ingredient['amount']
             )
-            print(ingredient)
+            for ingredient in ingredients
+        )
 
+    def update_ingredients(self, ingredients, recipe):
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        current = {
+            ingredient.ingredient_id: ingredient
+            for ingredient in recipe.amount_ingredients.all()
+        }
+        removed_ids = current.keys() - amounts.keys()
+        if removed_ids:
+            IngredientRecipes.objects.filter(
+                recipe=recipe,
+                ingredient_id__in=removed_ids
+            ).delete()
+        changed = []
+        for ingredient_id, ingredient in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != ingredient.amount:
+                ingredient.amount = amount
+                changed.append(ingredient)
+        if changed:
+            IngredientRecipes.objects.bulk_update(changed, ['amount'])
+        self.create_ingredients(
+            [
+                ingredient for ingredient in ingredients
+                if ingredient['id'] not in current
+            ],
+            recipe
+        )
+
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
-        self.create_ingredients(recipe=recipe, ingredients=ingredients)
+        self.create_ingredients(ingredients, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        instance.tags.set(tags)
-        IngredientRecipes.objects.filter(recipe=instance).delete()
-        super().update(instance, validated_data)
-        self.create_ingredients(ingredients, instance)
-        instance.save()
-        return instance
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            self.update_ingredients(ingredients, instance)
+        return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         request = self.context.get('request')
@@ -182,7 +360,10 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                                     context=context).data
 
 
-class RecipeFavoriteSerializer(serializers.ModelSerializer):
+class RecipeFavoriteSerializer(RecordSerializationMixin,
+                               serializers.ModelSerializer):
+    image = SerializerMethodField(read_only=True)
+
     class Meta:
         model = Recipe
         fields = (
@@ -192,8 +373,41 @@ class RecipeFavoriteSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
+    def get_image(self, obj):
+        return get_image_url(
+            self.context,
+            get_rendition(obj, 'image_card') or obj.image
+        )
+
+
+class CreateOnceSerializerMixin:
+    """Relies on the model's unique constraint instead of a pre-check.
+
+    A failed insert is rolled back to a savepoint and becomes a 400 only
+    if the row it collided with is really there, so concurrent requests
+    cannot end in an IntegrityError 500. A related object deleted in the
+    meantime gives a 404, any other integrity error propagates.
+    """
+
+    duplicate_message = None
 
-class FavoriteAndShoppingCartSerializerBase(serializers.ModelSerializer):
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            if self.Meta.model.objects.filter(**validated_data).exists():
+                raise serializers.ValidationError(self.duplicate_message)
+            if not all(
+                type(obj).objects.filter(pk=obj.pk).exists()
+                for obj in validated_data.values()
+            ):
+                raise NotFound
+            raise
+
+
+class FavoriteAndShoppingCartSerializerBase(CreateOnceSerializerMixin,
+                                            serializers.ModelSerializer):
     class Meta:
         model = Favorite
         abstract = True
@@ -201,16 +415,12 @@ class FavoriteAndShoppingCartSerializerBase(serializers.ModelSerializer):
             'user',
             'recipe'
         )
+        read_only_fields = fields
 
-    def validate(self, data):
-        user = data['user']
-        recipe = data['recipe']
-        if self.Meta.model.objects.filter(user=user, recipe=recipe).exists():
-            raise serializers.ValidationError(
-                f'Вы уже добавили рецепт в - \
-                    {self.Meta.model._meta.verbose_name_plural}'
-            )
-        return data
+    @property
+    def duplicate_message(self):
+        return (f'Вы уже добавили рецепт в - '
+                f'{self.Meta.model._meta.verbose_name_plural}')
 
 
 class FavoriteSerializer(FavoriteAndShoppingCartSerializerBase):
@@ -223,33 +433,48 @@ class ShoppingCartSerializer(FavoriteAndShoppingCartSerializerBase):
         model = ShoppingCart
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class RecipeBatchSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+
+    def validate_recipes(self, recipes):
+        return list(dict.fromkeys(recipes))
+
+
+class SubscriptionSerializer(CreateOnceSerializerMixin,
+                             serializers.ModelSerializer):
+    duplicate_message = 'Дважды на одного пользователя нельзя подписаться'
+
     class Meta:
         model = Subscription
         fields = (
             'user',
             'author'
         )
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Subscription.objects.all(),
-                fields=['user', 'author'],
-                message='Дважды на одного пользователя нельзя подписаться'
-            )
-        ]
+        read_only_fields = fields
 
-    def validate(self, data):
-        if data['author'] == data['user']:
+    def create(self, validated_data):
+        if validated_data['author'] == validated_data['user']:
             raise serializers.ValidationError('Нельзя подписаться на себя')
-        return data
+        return super().create(validated_data)
 
 
 class SubscriptionReadSerializer(UserSerializer):
-    recipes = RecipeFavoriteSerializer(many=True, read_only=True)
-    recipes_count = SerializerMethodField(read_only=True)
+    recipes = SerializerMethodField(read_only=True)
 
     class Meta(UserSerializer.Meta):
-        fields = UserSerializer.Meta.fields + ('recipes', 'recipes_count')
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        fields = UserSerializer.Meta.fields + ('recipes',)
+
+    def get_recipes(self, obj):
+        recipes = obj.recipes.all()
+        recipes_limit = get_recipes_limit(self.context.get('request'))
+        if recipes_limit is not None:
+            recipes = recipes[:recipes_limit]
+        return RecipeFavoriteSerializer(
+            recipes,
+            many=True,
+            context=self.context
+        ).data
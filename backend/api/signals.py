@@ -0,0 +1,140 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_token
+from api.autocomplete import ingredient_index
+from api.cache import (bump_version, invalidate_fragments,
+                       invalidate_user_flags)
+from api.fragments import refresh_recipe_fragments
+from recipes.models import (Favorite, Ingredient, IngredientRecipes, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Subscription, User
+
+
+def invalidate_recipes():
+    transaction.on_commit(lambda: bump_version('recipes'))
+
+
+def invalidate_all_fragments():
+    transaction.on_commit(lambda: bump_version('fragments'))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    def invalidate():
+        bump_version('ingredients')
+        ingredient_index.invalidate()
+
+    # A read before the commit would cache old data under the new version.
+    transaction.on_commit(invalidate)
+    invalidate_recipes()
+    invalidate_all_fragments()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(**kwargs):
+    transaction.on_commit(lambda: bump_version('tags'))
+    invalidate_recipes()
+    invalidate_all_fragments()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=IngredientRecipes)
+@receiver(post_delete, sender=IngredientRecipes)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe(**kwargs):
+    invalidate_recipes()
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    transaction.on_commit(
+        lambda: invalidate_fragments('author', [instance.id])
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_recipe_fragment(instance, created, **kwargs):
+    transaction.on_commit(lambda: refresh_recipe_fragments([instance.id]))
+    if created:
+        transaction.on_commit(
+            lambda: invalidate_fragments('author', [instance.author_id])
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_fragment(instance, **kwargs):
+    transaction.on_commit(
+        lambda: invalidate_fragments('recipe', [instance.id])
+    )
+    transaction.on_commit(
+        lambda: invalidate_fragments('author', [instance.author_id])
+    )
+
+
+@receiver(post_save, sender=IngredientRecipes)
+@receiver(post_delete, sender=IngredientRecipes)
+def refresh_ingredients_fragment(instance, **kwargs):
+    transaction.on_commit(
+        lambda: refresh_recipe_fragments([instance.recipe_id])
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def refresh_tags_fragment(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        transaction.on_commit(lambda: refresh_recipe_fragments([instance.id]))
+    elif pk_set:
+        transaction.on_commit(lambda: refresh_recipe_fragments(pk_set))
+    else:
+        invalidate_all_fragments()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def invalidate_favorites_fragment(instance, **kwargs):
+    transaction.on_commit(
+        lambda: invalidate_fragments('recipe', [instance.recipe_id])
+    )
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_followers_fragment(instance, **kwargs):
+    transaction.on_commit(
+        lambda: invalidate_fragments('author', [instance.author_id])
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_flags(instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_user_flags(instance.user_id))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+        'key', flat=True
+    ):
+        invalidate_token(key)
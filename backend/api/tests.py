@@ -0,0 +1,1351 @@
+import base64
+import csv
+import json
+import re
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework import serializers
+from rest_framework.exceptions import NotFound
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from api.async_views import async_read_view
+from api.authentication import local_token_cache
+from api.cache import get_version
+from api.metrics import registry
+from api.middleware import QueryRecorder, current_recorder
+from api.serializers import FavoriteSerializer
+from api.views import RecipeViewSet
+from recipes.feed import fan_out
+from recipes.renditions import generate_renditions
+from recipes.models import (Favorite, FeedEntry, Ingredient,
+                            IngredientRecipes, Recipe, ShoppingCart, Tag)
+from recipes.search import is_full_text_supported, update_search_vectors
+from users.models import Subscription, User
+
+
+class RecipeFixturesMixin:
+    @classmethod
+    def create_fixtures(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            first_name='Иван',
+            last_name='Петров',
+            password='author-password'
+        )
+        cls.user = User.objects.create_user(
+            email='user@example.com',
+            username='user',
+            first_name='Мария',
+            last_name='Сидорова',
+            password='user-password'
+        )
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {index:02}', measurement_unit='г')
+            for index in range(15)
+        )
+        cls.ingredients = list(Ingredient.objects.all())
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        caches['local'].clear()
+        local_token_cache.entries.clear()
+
+    @classmethod
+    def create_recipe(cls, author=None, name='Омлет', ingredients=3):
+        recipe = Recipe.objects.create(
+            author=author or cls.author,
+            name=name,
+            image='recipes/images/omelette.png',
+            text='Взбить яйца с молоком и пожарить.',
+            cooking_time=10
+        )
+        recipe.tags.add(cls.tag)
+        IngredientRecipes.objects.bulk_create(
+            IngredientRecipes(recipe=recipe, ingredient=ingredient, amount=5)
+            for ingredient in cls.ingredients[:ingredients]
+        )
+        return recipe
+
+
+class RecipeAPITestCase(RecipeFixturesMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_fixtures()
+
+
+class RecipeListQueriesTest(RecipeAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for index in range(8):
+            recipe = cls.create_recipe(name=f'Рецепт {index}', ingredients=15)
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def assertListQueries(self, queries, **params):
+        # Eight recipes: six on the first page and two on the second.
+        for page, size in ((1, 6), (2, 2)):
+            cache.clear()
+            with self.assertNumQueries(queries):
+                response = self.client.get(
+                    '/api/recipes/', {**params, 'page': page}
+                )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['results']), size)
+
+    def test_anonymous_list(self):
+        self.assertListQueries(7)
+
+    def test_authenticated_list(self):
+        self.client.force_authenticate(self.user)
+        self.assertListQueries(10)
+
+    def test_authenticated_filtered_list(self):
+        # Filtered lists are rendered by the serializer, which reads the
+        # flags from the queryset annotations.
+        self.client.force_authenticate(self.user)
+        self.assertListQueries(6, is_favorited=1)
+        recipe = self.client.get(
+            '/api/recipes/?is_favorited=1'
+        ).json()['results'][0]
+        self.assertTrue(recipe['is_favorited'])
+        self.assertTrue(recipe['is_in_shopping_cart'])
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+class KeysetPaginationTest(RecipeAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for index in range(5):
+            cls.create_recipe(name=f'Рецепт {index}')
+
+    def test_pages_follow_each_other(self):
+        ids = []
+        url = '/api/recipes/?cursor=&limit=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.json())
+            ids += [recipe['id'] for recipe in response.json()['results']]
+            url = response.json()['next']
+        self.assertEqual(
+            ids,
+            list(Recipe.objects.order_by(
+                '-pub_date', '-id'
+            ).values_list('id', flat=True))
+        )
+
+    def test_invalid_cursor(self):
+        for cursor in (
+            'not-base64!',
+            encode_cursor({'pub_date': 1}),
+            encode_cursor([1]),
+            encode_cursor(['garbage', 1]),
+            encode_cursor(['2024-01-01T00:00:00+00:00', 'x']),
+            encode_cursor([None, 1]),
+            encode_cursor([[], {}]),
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    '/api/recipes/', {'cursor': cursor}
+                )
+                self.assertEqual(response.status_code, 404)
+
+    def test_invalid_subscriptions_cursor(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(
+            '/api/users/subscriptions/',
+            {'cursor': encode_cursor(['garbage', 1])}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class AsyncReadViewTest(RecipeFixturesMixin, APITransactionTestCase):
+    # Async views query the database from pool threads, which do not see
+    # the transaction of a regular TestCase.
+
+    def setUp(self):
+        super().setUp()
+        # Commit hooks run here, keep image renditions out of the way.
+        patcher = mock.patch('recipes.signals.schedule_renditions')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.create_fixtures()
+        self.recipe = self.create_recipe()
+        self.create_recipe(name='Блины')
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        Subscription.objects.create(user=self.user, author=self.author)
+        self.token = Token.objects.create(user=self.user)
+        self.urls = (
+            '/api/recipes/',
+            f'/api/recipes/{self.recipe.id}/',
+            '/api/recipes/?is_favorited=1',
+            '/api/tags/',
+            '/api/users/',
+            '/api/users/subscriptions/',
+        )
+
+    def get_async(self, url, token=None):
+        match = resolve(url.split('?')[0])
+        # Django 3.2 turns extra arguments into raw ASGI headers.
+        headers = {} if token is None else {'AUTHORIZATION': f'Token {token}'}
+        request = AsyncRequestFactory().get(url, **headers)
+        response = async_to_sync(async_read_view(match.func))(
+            request, *match.args, **match.kwargs
+        )
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_responses_match_sync_views(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.get_async(url, self.token)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    json.loads(response.content),
+                    self.client.get(url).json()
+                )
+
+    def test_anonymous_flags(self):
+        data = json.loads(self.get_async('/api/recipes/').content)
+        self.assertFalse(any(
+            recipe['is_favorited'] or recipe['author']['is_subscribed']
+            for recipe in data['results']
+        ))
+
+    def test_queries_are_recorded(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        # A cold token cache may be missed by both concurrent lookups.
+        self.client.get('/api/users/me/')
+        for url in self.urls:
+            with self.subTest(url=url):
+                cache.clear()
+                with CaptureQueriesContext(connection) as sync:
+                    self.client.get(url)
+                cache.clear()
+                recorder = QueryRecorder()
+                token = current_recorder.set(recorder)
+                try:
+                    self.get_async(url, self.token)
+                finally:
+                    current_recorder.reset(token)
+                self.assertEqual(recorder.count, len(sync))
+
+
+class BatchEndpointsTest(RecipeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.first = self.create_recipe(name='Омлет')
+        self.second = self.create_recipe(name='Блины')
+
+    def batch(self, method, name, ids):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(
+                f'/api/recipes/{name}/batch/', {'recipes': ids},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        return {
+            result['id']: result['status']
+            for result in response.json()['results']
+        }
+
+    def get_favorites_count(self, recipe):
+        recipe.refresh_from_db()
+        return recipe.favorites_count
+
+    def test_add_favorites(self):
+        self.assertEqual(
+            self.batch('post', 'favorite', [self.first.id, 999]),
+            {self.first.id: 'created', 999: 'not_found'}
+        )
+        self.assertEqual(
+            self.batch('post', 'favorite', [self.first.id, self.second.id]),
+            {self.first.id: 'exists', self.second.id: 'created'}
+        )
+        self.assertEqual(self.get_favorites_count(self.first), 1)
+        self.assertEqual(self.get_favorites_count(self.second), 1)
+
+    def test_remove_favorites(self):
+        self.batch('post', 'favorite', [self.first.id, self.second.id])
+        self.assertEqual(
+            self.batch('delete', 'favorite', [self.first.id, 999]),
+            {self.first.id: 'deleted', 999: 'not_found'}
+        )
+        self.assertEqual(self.get_favorites_count(self.first), 0)
+        self.assertEqual(self.get_favorites_count(self.second), 1)
+        self.assertFalse(Favorite.objects.filter(
+            user=self.user, recipe=self.first
+        ).exists())
+
+    def test_remove_many_favorites(self):
+        recipes = [self.first, self.second] + [
+            self.create_recipe(name=f'Рецепт {index}') for index in range(8)
+        ]
+        ids = [recipe.id for recipe in recipes]
+        self.batch('post', 'favorite', ids)
+        with CaptureQueriesContext(connection) as queries:
+            results = self.batch('delete', 'favorite', ids)
+        self.assertEqual(set(results.values()), {'deleted'})
+        statements = [query['sql'].split()[0] for query in queries]
+        self.assertEqual(statements.count('DELETE'), 1)
+        self.assertEqual(statements.count('UPDATE'), 1)
+        self.assertFalse(Favorite.objects.exists())
+        self.assertFalse(Recipe.objects.filter(favorites_count__gt=0).exists())
+
+    def test_shopping_cart(self):
+        self.assertEqual(
+            self.batch('post', 'shopping_cart', [self.first.id]),
+            {self.first.id: 'created'}
+        )
+        self.assertEqual(
+            self.batch('delete', 'shopping_cart', [self.first.id]),
+            {self.first.id: 'deleted'}
+        )
+        self.assertFalse(ShoppingCart.objects.exists())
+
+    def test_concurrent_insert_is_reported_as_existing(self):
+        bulk_create = Favorite.objects.bulk_create
+
+        def insert_first(*args, **kwargs):
+            Favorite.objects.create(user=self.user, recipe=self.first)
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(
+            Favorite.objects, 'bulk_create', side_effect=insert_first
+        ):
+            results = self.batch('post', 'favorite', [self.first.id])
+        self.assertEqual(results, {self.first.id: 'exists'})
+        self.assertEqual(self.get_favorites_count(self.first), 1)
+
+    def test_cached_pages_follow_batches(self):
+        url = f'/api/recipes/{self.first.id}/'
+        self.client.get(url)
+        self.batch('post', 'favorite', [self.first.id])
+        recipe = self.client.get(url).json()
+        self.assertTrue(recipe['is_favorited'])
+        self.assertEqual(recipe['favorites_count'], 1)
+        self.batch('delete', 'favorite', [self.first.id])
+        recipe = self.client.get(url).json()
+        self.assertFalse(recipe['is_favorited'])
+        self.assertEqual(recipe['favorites_count'], 0)
+
+
+class RecipeIngredientsUpdateTest(RecipeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe()
+        self.url = f'/api/recipes/{self.recipe.id}/'
+        self.client.force_authenticate(self.author)
+
+    def get_rows(self):
+        return {
+            row.ingredient_id: row
+            for row in self.recipe.amount_ingredients.all()
+        }
+
+    def patch_ingredients(self, ingredients):
+        return self.client.patch(self.url, {
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in ingredients
+            ]
+        }, format='json')
+
+    def test_ingredients_are_diffed(self):
+        kept, changed, removed, added = self.ingredients[:4]
+        before = self.get_rows()
+        response = self.patch_ingredients(
+            ((kept, 5), (changed, 7), (added, 2))
+        )
+        self.assertEqual(response.status_code, 200)
+        rows = self.get_rows()
+        self.assertEqual(
+            {ingredient_id: row.amount for ingredient_id, row in rows.items()},
+            {kept.id: 5, changed.id: 7, added.id: 2}
+        )
+        # Kept and changed rows are updated in place, not recreated.
+        self.assertEqual(rows[kept.id].pk, before[kept.id].pk)
+        self.assertEqual(rows[changed.id].pk, before[changed.id].pk)
+        self.assertNotIn(removed.id, rows)
+
+    def test_duplicate_ingredients_are_rejected(self):
+        ingredient = self.ingredients[0]
+        response = self.patch_ingredients(((ingredient, 1), (ingredient, 2)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ingredients', response.json())
+        self.assertEqual(len(self.get_rows()), 3)
+
+    def test_unknown_ingredients_are_rejected(self):
+        missing_id = self.ingredients[-1].id + 100
+        response = self.client.patch(self.url, {
+            'ingredients': [
+                {'id': self.ingredients[0].id, 'amount': 1},
+                {'id': missing_id, 'amount': 1},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(missing_id), response.json()['ingredients'][0])
+        self.assertEqual(
+            {row.amount for row in self.get_rows().values()}, {5}
+        )
+
+
+class CountersTest(RecipeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.recipe = self.create_recipe()
+
+    def post(self, url):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url)
+
+    def delete(self, url):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.delete(url)
+
+    def test_favorites_count(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        self.assertEqual(self.post(url).status_code, 201)
+        self.assertEqual(
+            self.client.get(
+                f'/api/recipes/{self.recipe.id}/'
+            ).json()['favorites_count'],
+            1
+        )
+        self.assertEqual(self.delete(url).status_code, 204)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_recipes_and_followers_count(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        response = self.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['followers_count'], 1)
+        author = self.client.get(f'/api/users/{self.author.id}/').json()
+        self.assertEqual(author['recipes_count'], 1)
+        self.assertEqual(author['followers_count'], 1)
+        self.create_recipe(name='Блины')
+        self.recipe.delete()
+        self.assertEqual(self.delete(url).status_code, 204)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_full_save_keeps_counters(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        recipe.name = 'Омлет с сыром'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def test_repair_counters(self):
+        Recipe.objects.update(favorites_count=5)
+        User.objects.update(recipes_count=7, followers_count=3)
+        call_command('repair_counters', stdout=StringIO())
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_popular_ordering(self):
+        popular = self.create_recipe(name='Блины')
+        Favorite.objects.create(user=self.user, recipe=popular)
+        ids = [
+            recipe['id'] for recipe in self.client.get(
+                '/api/recipes/', {'ordering': 'popular'}
+            ).json()['results']
+        ]
+        self.assertEqual(ids, [popular.id, self.recipe.id])
+
+    def test_clicks_keep_the_page_cache(self):
+        self.client.get('/api/recipes/')
+        version = get_version('recipes')
+        self.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(get_version('recipes'), version)
+        recipe = self.client.get('/api/recipes/').json()['results'][0]
+        self.assertTrue(recipe['is_favorited'])
+        self.assertEqual(recipe['favorites_count'], 1)
+        self.assertTrue(recipe['author']['is_subscribed'])
+        self.assertEqual(recipe['author']['followers_count'], 1)
+
+
+class TrendingTest(RecipeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.fresh = self.create_recipe(name='Свежий')
+        Favorite.objects.create(user=self.user, recipe=self.fresh)
+        self.mixed = self.create_recipe(name='Смешанный', author=self.user)
+        self.mixed.tags.set([
+            Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        ])
+        Favorite.objects.create(user=self.user, recipe=self.mixed)
+        Favorite.objects.filter(recipe=self.mixed).update(
+            added_at=now - timedelta(hours=48)
+        )
+        ShoppingCart.objects.create(user=self.user, recipe=self.mixed)
+        self.old = self.create_recipe(name='Старый')
+        Favorite.objects.create(user=self.user, recipe=self.old)
+        Favorite.objects.filter(recipe=self.old).update(
+            added_at=now - timedelta(days=8)
+        )
+        Recipe.objects.filter(pk=self.old.pk).update(trending_score=5)
+        self.quiet = self.create_recipe(name='Тихий')
+
+    def get_ids(self, **params):
+        return [
+            recipe['id'] for recipe in self.client.get(
+                '/api/recipes/', {'ordering': 'trending', **params}
+            ).json()['results']
+        ]
+
+    def test_scores_decay(self):
+        call_command('compute_trending', stdout=StringIO())
+        scores = dict(Recipe.objects.values_list('id', 'trending_score'))
+        # A favorite weighs 1 and halves every 24 hours, a cart entry
+        # weighs 0.5; events outside the 7-day window are dropped.
+        self.assertAlmostEqual(scores[self.fresh.id], 1, places=3)
+        self.assertAlmostEqual(scores[self.mixed.id], 0.25 + 0.5, places=3)
+        self.assertEqual(scores[self.old.id], 0)
+        self.assertEqual(scores[self.quiet.id], 0)
+
+    def test_trending_ordering_with_filters(self):
+        call_command('compute_trending', stdout=StringIO())
+        fresh, mixed, old, quiet = (
+            self.fresh.id, self.mixed.id, self.old.id, self.quiet.id
+        )
+        self.assertEqual(self.get_ids(), [fresh, mixed, quiet, old])
+        self.assertEqual(self.get_ids(tags='breakfast'), [fresh, quiet, old])
+        self.assertEqual(
+            self.get_ids(author=self.author.id), [fresh, quiet, old]
+        )
+        self.assertEqual(
+            self.get_ids(tags='lunch', author=self.user.id), [mixed]
+        )
+
+
+class ImportIngredientsTest(RecipeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = f'{self.directory}/{name}'
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def run_import(self, *args):
+        stdout = StringIO()
+        call_command('import_ingredients_from_csv', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_repeated_import_adds_nothing(self):
+        path = self.write('ingredients.csv', (
+            'name,measurement_unit\n'
+            'Ингредиент 00,г\n'
+            'Мука,г\n'
+            ' Молоко , мл\n'
+        ))
+        self.assertIn('добавлено 2, пропущено 1', self.run_import(path))
+        self.assertIn('добавлено 0, пропущено 3', self.run_import(path))
+        self.assertTrue(
+            Ingredient.objects.filter(
+                name='Молоко', measurement_unit='мл'
+            ).exists()
+        )
+
+    def test_json_is_read_in_chunks(self):
+        names = [f'Специя {index:03}' for index in range(50)]
+        path = self.write('ingredients.json', json.dumps([
+            {'name': name, 'measurement_unit': 'г'} for name in names
+        ], ensure_ascii=False, indent=2))
+        with mock.patch(
+            'recipes.management.commands.import_ingredients_from_csv.'
+            'CHUNK_SIZE', 16
+        ):
+            self.run_import(path, '--batch-size', '7')
+        self.assertEqual(
+            list(Ingredient.objects.filter(
+                name__startswith='Специя'
+            ).order_by('name').values_list('name', flat=True)),
+            names
+        )
+
+    def test_truncated_json(self):
+        path = self.write(
+            'ingredients.json', '[{"name": "Мука", "measurement_unit"'
+        )
+        with self.assertRaisesMessage(CommandError, 'JSON-файл обрывается'):
+            self.run_import(path)
+
+    def test_stdin(self):
+        stdin = StringIO(
+            '{"name": "Мука", "measurement_unit": "г"}\n'
+            '\n'
+            '{"name": "Соль", "measurement_unit": "г"}\n'
+        )
+        with mock.patch('sys.stdin', stdin):
+            output = self.run_import('-', '--format', 'ndjson')
+        self.assertIn('добавлено 2', output)
+        self.assertEqual(
+            set(Ingredient.objects.filter(
+                name__in=('Мука', 'Соль')
+            ).values_list('name', flat=True)),
+            {'Мука', 'Соль'}
+        )
+
+
+class ImportRecipesTest(RecipeAPITestCase):
+    def get_line(self, author='new@example.com', tag=None):
+        return json.dumps({
+            'author': author,
+            'name': 'Сырники',
+            'text': 'Смешать творог с яйцом и обжарить.',
+            'cooking_time': 20,
+            'pub_date': '2023-01-01T00:00:00+00:00',
+            'image': 'recipes/images/syrniki.png',
+            'tags': [tag or {
+                'name': 'Ужин', 'color': '#49B64E', 'slug': 'dinner'
+            }],
+            'ingredients': [{
+                'name': 'Творог', 'measurement_unit': 'г', 'amount': 200
+            }],
+        }, ensure_ascii=False) + '\n'
+
+    def import_lines(self, *lines):
+        stdin = StringIO(''.join(lines))
+        with mock.patch('sys.stdin', stdin):
+            call_command('import_recipes', '-', stdout=StringIO())
+        return stdin
+
+    def test_import_from_stdin(self):
+        stdin = self.import_lines(
+            self.get_line(), self.get_line(tag={
+                'name': 'Завтрак', 'color': '#E26C2D', 'slug': 'breakfast'
+            })
+        )
+        self.assertFalse(stdin.closed)
+        self.assertEqual(
+            Recipe.objects.filter(author__email='new@example.com').count(), 2
+        )
+        self.assertEqual(Tag.objects.count(), 2)
+
+    def test_cached_references_are_refreshed(self):
+        self.assertEqual(len(self.client.get('/api/tags/').json()), 1)
+        self.assertEqual(
+            self.client.get('/api/ingredients/', {'name': 'твор'}).json(), []
+        )
+        self.assertEqual(self.client.get('/api/recipes/').json()['count'], 0)
+        self.import_lines(self.get_line())
+        self.assertEqual(
+            [tag['slug'] for tag in self.client.get('/api/tags/').json()],
+            ['breakfast', 'dinner']
+        )
+        self.assertEqual(
+            [ingredient['name'] for ingredient in self.client.get(
+                '/api/ingredients/', {'name': 'твор'}
+            ).json()],
+            ['Творог']
+        )
+        self.assertEqual(self.client.get('/api/recipes/').json()['count'], 1)
+
+    def test_tag_collision(self):
+        for tag in (
+            {'name': 'Завтрак', 'color': '#49B64E', 'slug': 'morning'},
+            {'name': 'Ужин', 'color': '#E26C2D', 'slug': 'morning'},
+        ):
+            with self.subTest(tag=tag):
+                with self.assertRaisesMessage(CommandError, 'breakfast'):
+                    self.import_lines(self.get_line(tag=tag))
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_author_username_collision(self):
+        User.objects.create_user(
+            email='other@example.com',
+            username='taken@example.com',
+            first_name='Олег',
+            last_name='Иванов',
+            password='other-password'
+        )
+        with self.assertRaisesMessage(CommandError, 'other@example.com'):
+            self.import_lines(self.get_line(author='taken@example.com'))
+        self.assertFalse(Recipe.objects.exists())
+
+
+class DuplicateWritesTest(RecipeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe()
+        self.client.force_authenticate(self.user)
+
+    def test_duplicates_are_rejected(self):
+        for url in (
+            f'/api/recipes/{self.recipe.id}/favorite/',
+            f'/api/recipes/{self.recipe.id}/shopping_cart/',
+            f'/api/users/{self.author.id}/subscribe/',
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.post(url).status_code, 201)
+                self.assertEqual(self.client.post(url).status_code, 400)
+                self.assertEqual(self.client.delete(url).status_code, 204)
+                self.assertEqual(self.client.delete(url).status_code, 404)
+
+    def test_subscribe_to_self(self):
+        response = self.client.post(f'/api/users/{self.user.id}/subscribe/')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Subscription.objects.exists())
+
+    def save_failing(self, recipe):
+        serializer = FavoriteSerializer(data={})
+        serializer.is_valid(raise_exception=True)
+        with mock.patch.object(
+            Favorite.objects, 'create', side_effect=IntegrityError
+        ):
+            serializer.save(user=self.user, recipe=recipe)
+
+    def test_other_integrity_errors_propagate(self):
+        with self.assertRaises(IntegrityError):
+            self.save_failing(self.recipe)
+
+    def test_deleted_recipe_is_not_found(self):
+        Recipe.objects.filter(pk=self.recipe.pk).delete()
+        with self.assertRaises(NotFound):
+            self.save_failing(self.recipe)
+
+
+@override_settings(API_INSTRUMENTATION=True)
+class InstrumentationTest(RecipeAPITestCase):
+    def test_server_timing(self):
+        with self.assertLogs('api.instrumentation', 'INFO'):
+            response = self.client.get('/api/recipes/')
+        self.assertIn('app;dur=', response['Server-Timing'])
+        self.assertIn('desc="non-DB"', response['Server-Timing'])
+
+    def test_serialization_is_timed(self):
+        to_representation = serializers.Serializer.to_representation
+
+        def slow_to_representation(serializer, instance):
+            time.sleep(0.01)
+            return to_representation(serializer, instance)
+
+        self.create_recipe()
+        cache.clear()
+        with mock.patch.object(
+            serializers.Serializer, 'to_representation',
+            slow_to_representation
+        ), self.assertLogs('api.instrumentation', 'INFO') as logs:
+            response = self.client.get('/api/recipes/')
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertGreaterEqual(record['serialize_ms'], 10)
+        # Nested serializers are timed by the outermost one only.
+        self.assertLessEqual(record['serialize_ms'], record['total_ms'])
+
+    def test_streaming_queries_are_recorded(self):
+        ShoppingCart.objects.create(
+            user=self.user, recipe=self.create_recipe()
+        )
+        self.client.force_authenticate(self.user)
+        with self.assertLogs('api.instrumentation', 'INFO') as logs:
+            response = self.client.get('/api/recipes/download_shopping_cart/')
+            self.assertEqual(logs.output, [])
+            content = b''.join(response.streaming_content)
+        self.assertIn('Ингредиент 00'.encode(), content)
+        self.assertNotIn('Server-Timing', response)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertTrue(record['streaming'])
+        self.assertGreater(record['queries'], 0)
+        self.assertIn('non_db_ms', record)
+
+    def test_metrics_access(self):
+        staff = User.objects.create_user(
+            email='staff@example.com',
+            username='staff',
+            first_name='Анна',
+            last_name='Кузнецова',
+            password='staff-password',
+            is_staff=True
+        )
+        for user, address, status in (
+            (None, '127.0.0.1', 200),
+            (None, '10.0.0.5', 401),
+            (self.user, '10.0.0.5', 403),
+            (staff, '10.0.0.5', 200),
+        ):
+            with self.subTest(user=user, address=address):
+                self.client.force_authenticate(user)
+                with self.assertLogs('api.instrumentation', 'INFO'):
+                    response = self.client.get(
+                        '/api/metrics/', REMOTE_ADDR=address
+                    )
+                self.assertEqual(response.status_code, status)
+
+
+def make_png(name='dish.png', size=(4, 4)):
+    buffer = BytesIO()
+    Image.new('RGB', size, '#E26C2D').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/png')
+
+
+class ImageUploadTest(RecipeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_authenticate(self.user)
+
+    def upload(self):
+        response = self.client.post(
+            '/api/recipes/images/', {'image': make_png()}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()['token']
+
+    def get_recipe_data(self, image):
+        return {
+            'name': 'Сырники',
+            'text': 'Смешать творог с яйцом и обжарить.',
+            'cooking_time': 20,
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredients[0].id, 'amount': 200}],
+            'image': image,
+        }
+
+    def test_create_with_token(self):
+        token = self.upload()
+        response = self.client.post(
+            '/api/recipes/', self.get_recipe_data(token), format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(name='Сырники')
+        self.assertEqual(recipe.author, self.user)
+        self.assertTrue(default_storage.exists(recipe.image.name))
+
+    def test_invalid_tokens(self):
+        token = self.upload()
+        self.client.force_authenticate(self.author)
+        for image in (token, token[:-1] + 'x'):
+            with self.subTest(image=image):
+                response = self.client.post(
+                    '/api/recipes/', self.get_recipe_data(image),
+                    format='json'
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('image', response.json())
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_multipart_create(self):
+        data = self.get_recipe_data(make_png())
+        data['ingredients'] = json.dumps(data['ingredients'])
+        response = self.client.post(
+            '/api/recipes/', data, format='multipart'
+        )
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(name='Сырники')
+        self.assertEqual(list(recipe.tags.all()), [self.tag])
+        self.assertEqual(
+            recipe.amount_ingredients.get().ingredient, self.ingredients[0]
+        )
+        self.assertTrue(default_storage.exists(recipe.image.name))
+
+    def create_with_renditions(self):
+        patcher = mock.patch('recipes.feed.executor')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('recipes.renditions.executor')
+        executor = patcher.start()
+        self.addCleanup(patcher.stop)
+        # Run the rendition pool inline, within the test transaction.
+        executor.submit.side_effect = (
+            lambda func, recipe_id: generate_renditions(recipe_id)
+        )
+        data = self.get_recipe_data(make_png(size=(1600, 1200)))
+        data['ingredients'] = json.dumps(data['ingredients'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/', data, format='multipart'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.json()['image'].endswith('dish.png'))
+        executor.submit.assert_called_once()
+        return Recipe.objects.get(name='Сырники')
+
+    def test_renditions_are_generated(self):
+        recipe = self.create_with_renditions()
+        for field, size in (
+            ('image_card', (480, 360)), ('image_detail', (1200, 900))
+        ):
+            with self.subTest(field=field):
+                name = getattr(recipe, field).name
+                self.assertTrue(name.endswith(f'_{field}.webp'))
+                with default_storage.open(name) as file:
+                    self.assertEqual(Image.open(file).size, size)
+
+    def test_read_serializers_use_renditions(self):
+        recipe = self.create_with_renditions()
+        listed = self.client.get('/api/recipes/').json()['results'][0]
+        self.assertTrue(listed['image'].endswith(recipe.image_card.url))
+        detail = self.client.get(f'/api/recipes/{recipe.id}/').json()
+        self.assertTrue(detail['image'].endswith(recipe.image_detail.url))
+
+    def test_stale_renditions_are_ignored(self):
+        recipe = self.create_with_renditions()
+        # A new image whose renditions are not generated yet.
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image='recipes/images/pancakes.png'
+        )
+        cache.clear()
+        detail = self.client.get(f'/api/recipes/{recipe.id}/').json()
+        self.assertTrue(detail['image'].endswith('pancakes.png'))
+
+
+class FeedTest(RecipeAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for index in range(3):
+            cls.create_recipe(name=f'Рецепт {index}')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        # Fan-out runs in a pool thread that would not see the test
+        # transaction, so it is run inline; renditions are skipped.
+        patcher = mock.patch('recipes.feed.executor')
+        patcher.start().submit.side_effect = (
+            lambda func, recipe_id: fan_out(recipe_id)
+        )
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('recipes.signals.schedule_renditions')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def subscribe(self):
+        response = self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+
+    def get_feed(self, limit=2):
+        ids = []
+        url = f'/api/recipes/feed/?limit={limit}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.json()['results']]
+            url = response.json()['next']
+        return ids
+
+    def get_recipe_ids(self):
+        return list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+
+    def test_subscribe_fills_the_feed(self):
+        self.assertEqual(self.get_feed(), [])
+        self.subscribe()
+        self.assertEqual(FeedEntry.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(self.get_feed(), self.get_recipe_ids())
+
+    def test_new_recipes_are_pushed(self):
+        self.subscribe()
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = self.create_recipe(name='Новый рецепт')
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.user, recipe=recipe).exists()
+        )
+        self.assertEqual(self.get_feed(), self.get_recipe_ids())
+
+    @override_settings(FEED_MAX_LENGTH=2)
+    def test_feed_is_trimmed(self):
+        self.subscribe()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_recipe(name='Новый рецепт')
+        self.assertEqual(self.get_feed(), self.get_recipe_ids()[:2])
+
+    def test_feeds_are_trimmed_at_once(self):
+        readers = [
+            User.objects.create_user(
+                email=f'reader{index}@example.com',
+                username=f'reader{index}',
+                first_name='Олег',
+                last_name='Смирнов',
+                password='reader-password'
+            )
+            for index in range(4)
+        ]
+        *followers, other = readers
+        for follower in followers:
+            Subscription.objects.create(user=follower, author=self.author)
+        for index in range(3):
+            self.create_recipe(author=self.user, name=f'Чужой {index}')
+        Subscription.objects.create(user=other, author=self.user)
+        with override_settings(FEED_MAX_LENGTH=2), \
+                CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.create_recipe(name='Новый рецепт')
+        deletes = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('DELETE')
+        ]
+        self.assertEqual(len(deletes), 1)
+        newest = list(Recipe.objects.filter(author=self.author).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True)[:2])
+        for follower in followers:
+            self.assertEqual(
+                list(FeedEntry.objects.filter(user=follower).order_by(
+                    '-pub_date', '-recipe_id'
+                ).values_list('recipe_id', flat=True)),
+                newest
+            )
+        self.assertEqual(FeedEntry.objects.filter(user=other).count(), 3)
+
+    def test_unsubscribe_clears_the_feed(self):
+        self.subscribe()
+        response = self.client.delete(
+            f'/api/users/{self.author.id}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+        self.assertEqual(self.get_feed(), [])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_big_authors_are_read_directly(self):
+        self.subscribe()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_recipe(name='Новый рецепт')
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+        self.assertEqual(self.get_feed(), self.get_recipe_ids())
+
+
+class SearchTest(RecipeAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.by_name = cls.create_recipe(name='паста с творогом')
+        cls.by_text = cls.create_recipe(name='Запеканка')
+        Recipe.objects.filter(pk=cls.by_text.pk).update(
+            text='Смешать творог <b>с яйцом</b> и запечь.'
+        )
+        cls.by_ingredient = cls.create_recipe(name='Вареники')
+        IngredientRecipes.objects.create(
+            recipe=cls.by_ingredient,
+            ingredient=Ingredient.objects.create(
+                name='творог', measurement_unit='г'
+            ),
+            amount=300
+        )
+        cls.create_recipe(name='Блины')
+        update_search_vectors(Recipe.objects.all())
+
+    def search(self):
+        response = self.client.get('/api/recipes/', {'search': 'творог'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_search_matches_name_text_and_ingredients(self):
+        self.assertEqual(
+            {recipe['id'] for recipe in self.search()},
+            {self.by_name.id, self.by_text.id, self.by_ingredient.id}
+        )
+
+    def test_ranking_and_snippets(self):
+        results = self.search()
+        if not is_full_text_supported(Recipe.objects.all()):
+            self.assertNotIn('search_snippet', results[0])
+            return
+        self.assertEqual(results[0]['id'], self.by_name.id)
+        snippets = {
+            recipe['id']: recipe['search_snippet'] for recipe in results
+        }
+        self.assertIn(
+            '<mark>творог</mark> &lt;b&gt;с яйцом&lt;/b&gt;',
+            snippets[self.by_text.id]
+        )
+
+
+class TokenCacheTest(RecipeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        response = self.client.post('/api/auth/token/login/', {
+            'email': 'user@example.com', 'password': 'user-password'
+        })
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {response.json()["auth_token"]}'
+        )
+
+    def get_lookups(self):
+        series = registry.values['api_token_cache_requests_total']
+        return {
+            result: series.get((('result', result),), 0)
+            for result in ('hit', 'miss')
+        }
+
+    def get_me(self, status=200):
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def assertLookups(self, before, hit=0, miss=0):
+        after = self.get_lookups()
+        self.assertEqual(after['hit'] - before['hit'], hit)
+        self.assertEqual(after['miss'] - before['miss'], miss)
+
+    def test_token_is_cached(self):
+        before = self.get_lookups()
+        self.get_me()
+        self.get_me()
+        self.assertLookups(before, hit=1, miss=1)
+
+    def test_logout(self):
+        self.get_me()
+        self.assertEqual(
+            self.client.post('/api/auth/token/logout/').status_code, 204
+        )
+        self.get_me(status=401)
+
+    def test_deactivation(self):
+        self.get_me()
+        self.user.is_active = False
+        self.user.save()
+        self.get_me(status=401)
+
+    def test_password_change(self):
+        self.get_me()
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'user-password',
+            'new_password': 'new-user-password',
+        })
+        self.assertEqual(response.status_code, 204)
+        before = self.get_lookups()
+        self.get_me()
+        self.assertLookups(before, miss=1)
+
+    def test_last_login_keeps_the_cache(self):
+        self.get_me()
+        User.objects.get(pk=self.user.pk).save(update_fields=['last_login'])
+        before = self.get_lookups()
+        self.get_me()
+        self.assertLookups(before, hit=1)
+
+
+class FragmentParityTest(RecipeAPITestCase):
+    urls = (
+        '/api/recipes/',
+        '/api/recipes/?page=2',
+        '/api/recipes/?cursor=',
+        '/api/recipes/?ordering=popular',
+        '/api/recipes/?tags=breakfast',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Ingredient.objects.filter(pk=cls.ingredients[1].pk).update(
+            name='масло "сливочное" \\ ё'
+        )
+        for index in range(8):
+            cls.create_recipe(
+                author=(cls.author, cls.user)[index % 2],
+                name=f'Рецепт "{index}" ё\n',
+                ingredients=index % 4 + 1
+            )
+        cls.recipe = Recipe.objects.order_by('id').first()
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('recipes.signals.schedule_renditions')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertParity(self, url):
+        response = self.client.get(url)
+        with mock.patch.object(
+            RecipeViewSet, 'is_cacheable', return_value=False
+        ):
+            reference = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), reference.json())
+
+    def assertAllParity(self):
+        for user in (None, self.user):
+            self.client.force_authenticate(user)
+            for url in self.urls + (f'/api/recipes/{self.recipe.id}/',):
+                with self.subTest(user=user, url=url):
+                    self.assertParity(url)
+                    # The second request is served from the page cache.
+                    self.assertParity(url)
+
+    def test_parity(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.user, recipe=self.recipe)
+            ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+            Subscription.objects.create(user=self.user, author=self.author)
+        self.assertAllParity()
+
+    @override_settings(ALLOWED_HOSTS=['foodgram.example.com'])
+    def test_benchmark_command(self):
+        stdout = StringIO()
+        call_command('benchmark_fragments', repeat=1, stdout=stdout)
+        self.assertIn('Ускорение', stdout.getvalue())
+
+    def rename_author(self):
+        self.author.first_name = 'Пётр'
+        self.author.save()
+
+    def rename_tag(self):
+        self.tag.name = 'Поздний завтрак'
+        self.tag.save()
+
+    def change_amount(self):
+        amount = self.recipe.amount_ingredients.first()
+        amount.amount = 99
+        amount.save()
+
+    def add_tag(self):
+        self.recipe.tags.add(
+            Tag.objects.create(name='Ужин', color='#49B64E', slug='dinner')
+        )
+
+    def test_parity_after_changes(self):
+        self.assertAllParity()
+        for change in (
+            self.change_amount, self.add_tag,
+            self.rename_author, self.rename_tag,
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertAllParity()
+
+
+class ReferenceCacheTest(RecipeAPITestCase):
+    def test_etag_and_not_modified(self):
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_version_is_bumped_on_commit(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Ужин', color='#49B64E', slug='dinner')
+            # Reads inside the transaction keep the old version.
+            response = self.client.get(
+                '/api/tags/', HTTP_IF_NONE_MATCH=etag
+            )
+            self.assertEqual(response.status_code, 304)
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_ingredients_are_refreshed_on_commit(self):
+        url = '/api/ingredients/'
+        self.assertEqual(self.client.get(url, {'name': 'твор'}).json(), [])
+        version = get_version('ingredients')
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Творог', measurement_unit='г')
+            self.assertEqual(get_version('ingredients'), version)
+        self.assertEqual(
+            [item['name'] for item in self.client.get(
+                url, {'name': 'твор'}
+            ).json()],
+            ['Творог']
+        )
+        self.assertEqual(len(self.client.get(url).json()), 16)
+
+
+class ShoppingListTest(RecipeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        for name in ('Омлет', 'Блины'):
+            ShoppingCart.objects.create(
+                user=self.user, recipe=self.create_recipe(name=name)
+            )
+
+    def download(self, file_type):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'file_type': file_type}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_shared_ingredients_with_equal_amounts(self):
+        response, content = self.download('txt')
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertEqual(content.decode().splitlines(), [
+            'Список покупок:',
+            'Ингредиент 00 (г) - 10',
+            'Ингредиент 01 (г) - 10',
+            'Ингредиент 02 (г) - 10',
+        ])
+        _, content = self.download('csv')
+        rows = list(csv.reader(content.decode().splitlines()))
+        self.assertEqual(rows[1:], [
+            [f'Ингредиент 0{index}', 'г', '10'] for index in range(3)
+        ])
+
+    def test_pdf_is_paginated(self):
+        recipe = self.create_recipe(name='Салат', ingredients=15)
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Продукт {index:02}', measurement_unit='шт')
+            for index in range(45)
+        )
+        IngredientRecipes.objects.bulk_create(
+            IngredientRecipes(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in Ingredient.objects.filter(
+                name__startswith='Продукт'
+            )
+        )
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        response, content = self.download('pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertEqual(len(re.findall(rb'/Type /Page\b', content)), 2)
+
+    def test_unknown_format(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'file_type': 'xls'}
+        )
+        self.assertEqual(response.status_code, 400)
@@ -1,8 +1,10 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
+from api.async_views import make_async_read_urls
 from api.views import (CustomUserViewSet, IngredientViewSet, RecipeViewSet,
-                       TagViewSet)
+                       TagViewSet, metrics)
 
 app_name = 'api'
 
@@ -12,9 +14,15 @@ router_v1.register(r'tags', TagViewSet, basename='tag')
 router_v1.register(r'ingredients', IngredientViewSet, basename='ingredient')
 router_v1.register(r'users', CustomUserViewSet, basename='users')
 
+router_urls = router_v1.urls
+if settings.API_ASYNC_VIEWS:
+    router_urls = make_async_read_urls(router_urls, (
+        RecipeViewSet, TagViewSet, IngredientViewSet, CustomUserViewSet
+    ))
 
 urlpatterns = [
-    path('', include(router_v1.urls)),
+    path('metrics/', metrics, name='metrics'),
+    path('', include(router_urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
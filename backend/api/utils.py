@@ -1,38 +1,232 @@
+import csv
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from recipes.models import Recipe
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from api.cache import invalidate_fragments, invalidate_user_flags
+from recipes.models import Favorite, IngredientRecipes, Recipe
 from users.models import Subscription
 
+PDF_FONT = 'DejaVuSans'
+PDF_FONT_PATH = Path(settings.BASE_DIR) / 'data' / 'fonts' / 'DejaVuSans.ttf'
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+PDF_CHUNK_SIZE = 64 * 1024
 
-def create_object(request, pk, serializer_in, serializer_out, model):
-    user = request.user.id
-    obj = get_object_or_404(model, id=pk)
 
-    data_recipe = {'user': user, 'recipe': obj.id}
-    data_subscribe = {'user': user, 'author': obj.id}
+class Echo:
+    def write(self, value):
+        return value
+
+
+def get_shopping_list(user):
+    return IngredientRecipes.objects.filter(
+        recipe__cart__user=user
+    ).values(
+        'ingredient',
+        'ingredient__name',
+        'ingredient__measurement_unit'
+    ).annotate(
+        total_amount=Sum('amount')
+    ).order_by('ingredient__name')
+
+
+def format_shopping_list_item(ingredient):
+    return '{} ({}) - {}'.format(
+        ingredient['ingredient__name'],
+        ingredient['ingredient__measurement_unit'],
+        ingredient['total_amount']
+    )
+
+
+def render_shopping_list_txt(ingredients):
+    yield 'Список покупок:\n'
+    for ingredient in ingredients.iterator():
+        yield format_shopping_list_item(ingredient) + '\n'
+
+
+def render_shopping_list_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Единица измерения', 'Количество'))
+    for ingredient in ingredients.iterator():
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['total_amount']
+        ))
+
+
+def render_shopping_list_pdf(ingredients):
+    # The canvas keeps the pages until save(), so the document is built
+    # page by page while rows are read and then sent in chunks.
+    if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(PDF_FONT, PDF_FONT_PATH))
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    page = 1
+
+    def start_page(title):
+        pdf.setFont(PDF_FONT, PDF_FONT_SIZE)
+        pdf.drawRightString(
+            width - PDF_MARGIN, PDF_MARGIN / 2, f'Страница {page}'
+        )
+        pdf.drawString(PDF_MARGIN, height - PDF_MARGIN, title)
+        return height - PDF_MARGIN - PDF_LINE_HEIGHT * 2
+
+    y = start_page('Список покупок:')
+    for ingredient in ingredients.iterator():
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            page += 1
+            y = start_page('Список покупок (продолжение):')
+        pdf.drawString(PDF_MARGIN, y, format_shopping_list_item(ingredient))
+        y -= PDF_LINE_HEIGHT
+    pdf.save()
+    content = buffer.getbuffer()
+    for start in range(0, len(content), PDF_CHUNK_SIZE):
+        yield bytes(content[start:start + PDF_CHUNK_SIZE])
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', render_shopping_list_txt),
+    'csv': ('text/csv; charset=utf-8', render_shopping_list_csv),
+    'pdf': ('application/pdf', render_shopping_list_pdf),
+}
 
-    if model is Recipe:
-        serializer = serializer_in(data=data_recipe)
-    else:
-        serializer = serializer_in(data=data_subscribe)
 
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit is None or not recipes_limit.isdigit():
+        return None
+    return int(recipes_limit)
+
+
+def get_limited_recipes(recipes_limit):
+    recipes = Recipe.objects.all()
+    if recipes_limit is None:
+        return recipes
+    return recipes.filter(id__in=Subquery(
+        Recipe.objects.filter(
+            author=OuterRef('author')
+        ).values('id')[:recipes_limit]
+    ))
+
+
+def create_object(request, pk, serializer_in, serializer_out, model):
+    obj = get_object_or_404(model, id=pk)
+    serializer = serializer_in(data={})
     serializer.is_valid(raise_exception=True)
-    serializer.save()
+    if model is Recipe:
+        serializer.save(user=request.user, recipe=obj)
+    else:
+        serializer.save(user=request.user, author=obj)
+        # The signal raised followers_count with an F() update.
+        obj.refresh_from_db(fields=['followers_count'])
     serializer_to_response = serializer_out(obj, context={'request': request})
     return serializer_to_response
 
 
-def delete_object(request, pk, model_object, model_for_delete_object):
-    user = request.user
-
-    obj_recipe = get_object_or_404(model_object, id=pk)
-    obj_subscription = get_object_or_404(model_object, id=pk)
-
+def delete_object(request, pk, model_for_delete_object):
     if model_for_delete_object is Subscription:
-        object = get_object_or_404(
-            model_for_delete_object, user=user, author=obj_subscription
+        objects = model_for_delete_object.objects.filter(
+            user=request.user, author_id=pk
         )
     else:
-        object = get_object_or_404(
-            model_for_delete_object, user=user, recipe=obj_recipe
+        objects = model_for_delete_object.objects.filter(
+            user=request.user, recipe_id=pk
         )
-    object.delete()
+    deleted, _ = objects.delete()
+    if not deleted:
+        raise Http404
+
+
+def update_after_bulk_write(user, model, recipe_ids, delta):
+    # bulk_create and delete_rows skip model signals, so counters and
+    # caches are updated here once for the whole batch.
+    if not recipe_ids:
+        return
+    if model is Favorite:
+        recipes = Recipe.objects.filter(id__in=recipe_ids)
+        if delta < 0:
+            recipes = recipes.filter(favorites_count__gt=0)
+        recipes.update(favorites_count=F('favorites_count') + delta)
+        transaction.on_commit(
+            lambda: invalidate_fragments('recipe', recipe_ids)
+        )
+    transaction.on_commit(lambda: invalidate_user_flags(user.id))
+
+
+def delete_rows(model, pks):
+    # QuerySet.delete() deletes row by row while post_delete receivers
+    # are connected, so the batch is removed with a single statement.
+    if not pks:
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM {} WHERE {} IN ({})'.format(
+                table, column, ', '.join(['%s'] * len(pks))
+            ),
+            pks
+        )
+
+
+@transaction.atomic
+def create_objects_batch(user, recipe_ids, model):
+    found = set(Recipe.objects.filter(
+        id__in=recipe_ids
+    ).values_list('id', flat=True))
+    # ignore_conflicts does not report which rows were skipped, and a
+    # concurrent request may insert the same rows at any moment. The
+    # rows inserted here are the ones carrying this call's timestamp.
+    added_at = timezone.now()
+    model.objects.bulk_create(
+        (model(user=user, recipe_id=recipe_id, added_at=added_at)
+         for recipe_id in found),
+        ignore_conflicts=True
+    )
+    created = set(model.objects.filter(
+        user=user, recipe_id__in=found, added_at=added_at
+    ).values_list('recipe_id', flat=True))
+    update_after_bulk_write(user, model, created, 1)
+    return [
+        {
+            'id': recipe_id,
+            'status': (
+                'not_found' if recipe_id not in found
+                else 'created' if recipe_id in created
+                else 'exists'
+            ),
+        }
+        for recipe_id in recipe_ids
+    ]
+
+
+@transaction.atomic
+def delete_objects_batch(user, recipe_ids, model):
+    rows = dict(model.objects.select_for_update().filter(
+        user=user, recipe_id__in=recipe_ids
+    ).values_list('pk', 'recipe_id'))
+    delete_rows(model, list(rows))
+    deleted = set(rows.values())
+    update_after_bulk_write(user, model, deleted, -1)
+    return [
+        {
+            'id': recipe_id,
+            'status': 'deleted' if recipe_id in deleted else 'not_found',
+        }
+        for recipe_id in recipe_ids
+    ]
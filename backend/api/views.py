@@ -1,41 +1,85 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.shortcuts import HttpResponse
+from django.db.models import Exists, F, OuterRef, Prefetch, Value
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
-from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import (SAFE_METHODS, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 
-from api.filters import RecipeFilter
-from api.permissions import IsOwnerOrReadOnly
+from api.autocomplete import ingredient_index
+from api.cache import ReferenceCacheMixin
+from api.filters import (DEFAULT_RECIPE_ORDERING, RECIPE_ORDERINGS,
+                         RecipeFilter)
+from api.fragments import RecipeCacheMixin, get_page
+from api.metrics import registry
+from api.pagination import KeysetPagination, PageNumberOrKeysetPagination
+from api.permissions import IsOwnerOrReadOnly, IsStaffOrAllowedIP
 from api.serializers import (FavoriteSerializer, IngredientSerializer,
-                             RecipeFavoriteSerializer, RecipeReadSerializer,
-                             RecipeWriteSerializer, ShoppingCartSerializer,
+                             RecipeBatchSerializer, RecipeFavoriteSerializer,
+                             RecipeImageUploadSerializer,
+                             RecipeReadSerializer, RecipeWriteSerializer,
+                             ShoppingCartSerializer,
                              SubscriptionReadSerializer,
                              SubscriptionSerializer, TagSerializer,
                              UserSerializer)
-from api.utils import create_object, delete_object
+from api.utils import (SHOPPING_LIST_FORMATS, create_object,
+                       create_objects_batch, delete_object,
+                       delete_objects_batch, get_limited_recipes,
+                       get_recipes_limit, get_shopping_list)
+from recipes.feed import get_feed_filter
 from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
 from users.models import Subscription
 
 User = get_user_model()
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    pagination_class = PageNumberPagination
+@api_view(['GET'])
+@permission_classes([IsStaffOrAllowedIP])
+def metrics(request):
+    if not settings.API_INSTRUMENTATION:
+        raise Http404
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+class RecipeViewSet(RecipeCacheMixin, viewsets.ModelViewSet):
+    pagination_class = PageNumberOrKeysetPagination
     permission_classes = (IsOwnerOrReadOnly, IsAuthenticatedOrReadOnly)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
     def get_queryset(self):
-        recipes = Recipe.objects.prefetch_related(
+        user = self.request.user
+        recipes = Recipe.objects.select_related('author').prefetch_related(
             'amount_ingredients__ingredient', 'tags'
-        ).all()
-        return recipes
+        )
+        if user.is_anonymous:
+            return recipes.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False)
+            )
+        return recipes.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        )
+
+    @property
+    def keyset_ordering(self):
+        return RECIPE_ORDERINGS.get(
+            self.request.query_params.get('ordering'),
+            DEFAULT_RECIPE_ORDERING
+        )
 
     def perform_create(self, serializer):
         return serializer.save(author=self.request.user)
@@ -45,6 +89,18 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    @action(detail=False, methods=['post'], url_path='images',
+            permission_classes=(IsAuthenticated,),
+            parser_classes=(MultiPartParser,))
+    def upload_image(self, request):
+        serializer = RecipeImageUploadSerializer(
+            data=request.data,
+            context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['post', 'delete'])
     def favorite(self, request, pk):
         if request.method == 'POST':
@@ -59,7 +115,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 serializer.data,
                 status=status.HTTP_201_CREATED
             )
-        delete_object(request, pk, Recipe, Favorite)
+        delete_object(request, pk, Favorite)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['post', 'delete'])
@@ -76,54 +132,111 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 serializer.data,
                 status=status.HTTP_201_CREATED
             )
-        delete_object(request, pk, Recipe, ShoppingCart)
+        delete_object(request, pk, ShoppingCart)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(detail=False, methods=['get'],
+    def change_batch(self, request, model):
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            results = create_objects_batch(request.user, recipe_ids, model)
+        else:
+            results = delete_objects_batch(request.user, recipe_ids, model)
+        return Response({'results': results})
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='favorite/batch',
             permission_classes=(IsAuthenticated,))
-    def download_shopping_cart(self, request):
-        ingredient_lst = ShoppingCart.objects.filter(
-            user=request.user
-        ).values_list(
-            'recipe_id__ingredients__name',
-            'recipe_id__ingredients__measurement_unit',
-            Sum('recipe_id__ingredients__amount_ingredients__amount'))
+    def favorite_batch(self, request):
+        return self.change_batch(request, Favorite)
 
-        shopping_list = ['Список покупок:']
-        ingredient_lst = set(ingredient_lst)
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='shopping_cart/batch',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_batch(self, request):
+        return self.change_batch(request, ShoppingCart)
 
-        for ingredient in ingredient_lst:
-            shopping_list.append('{} ({}) - {}'.format(*ingredient))
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        queryset = self.get_page_queryset().filter(
+            get_feed_filter(request.user)
+        )
+        paginator = KeysetPagination(self.keyset_ordering)
+        recipes = paginator.paginate_queryset(queryset, request, self)
+        return self.get_fragment_response(request, get_page(
+            paginator.get_paginated_response([]).data, recipes
+        ))
 
-        response = HttpResponse('\n'.join(shopping_list),
-                                content_type='text/plain')
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,))
+    def download_shopping_cart(self, request):
+        file_type = request.query_params.get('file_type', 'txt')
+        if file_type not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'file_type': 'Доступные форматы: {}'.format(
+                    ', '.join(SHOPPING_LIST_FORMATS)
+                )},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        content_type, render = SHOPPING_LIST_FORMATS[file_type]
+        response = StreamingHttpResponse(
+            render(get_shopping_list(request.user)),
+            content_type=content_type
+        )
         response['Content-Disposition'] = \
-            'attachment; filename="shopping_list.txt"'
+            f'attachment; filename="shopping_list.{file_type}"'
         return response
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ReferenceCacheMixin, viewsets.ModelViewSet):
+    reference_name = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ReferenceCacheMixin, viewsets.ModelViewSet):
+    reference_name = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
 
     def get_queryset(self):
-        queryset = Ingredient.objects.all()
         ingredients_name = self.request.query_params.get('name')
-        if ingredients_name is not None:
-            queryset = queryset.filter(name__istartswith=ingredients_name)
-        return queryset
+        if self.action == 'list' and ingredients_name is not None:
+            return ingredient_index.search(ingredients_name)
+        return Ingredient.objects.all()
 
 
 class CustomUserViewSet(UserViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    pagination_class = PageNumberOrKeysetPagination
+
+    @property
+    def keyset_ordering(self):
+        if self.action == 'subscriptions':
+            return ('-subscription_id', '-id')
+        return None
+
+    def get_queryset(self):
+        user = self.request.user
+        if self.action == 'subscriptions':
+            return self.get_subscriptions_queryset()
+        queryset = super().get_queryset()
+        if user.is_anonymous:
+            return queryset.annotate(is_subscribed=Value(False))
+        return queryset.annotate(
+            is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('pk')
+            ))
+        )
+
+    def get_instance(self):
+        # request.user may be a cached snapshot, so read current counters.
+        return self.get_queryset().get(pk=self.request.user.pk)
 
     @action(detail=True, methods=['post', 'delete'])
     def subscribe(self, request, id):
@@ -139,15 +252,28 @@ class CustomUserViewSet(UserViewSet):
                 serializer.data,
                 status=status.HTTP_201_CREATED
             )
-        delete_object(request, id, User, Subscription)
+        delete_object(request, id, Subscription)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(detail=False, methods=['get'])
-    def subscriptions(self, request):
-        user = request.user
-        authors = User.objects.filter(subscribing__user=user)
+    def get_subscriptions_queryset(self):
+        return User.objects.filter(
+            subscribing__user=self.request.user
+        ).annotate(
+            is_subscribed=Value(True),
+            subscription_id=F('subscribing__id')
+        ).prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=get_limited_recipes(
+                    get_recipes_limit(self.request)
+                )
+            )
+        ).order_by('username')
 
-        paged_queryset = self.paginate_queryset(authors)
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,))
+    def subscriptions(self, request):
+        paged_queryset = self.paginate_queryset(self.get_queryset())
         serializer = SubscriptionReadSerializer(
             paged_queryset,
             context={'request': request},
@@ -0,0 +1,20 @@
+class DerivedFieldsMixin:
+    """Leave derived columns out of full saves of an existing row.
+
+    Counters, scores and search vectors are changed with queryset updates
+    from signals and periodic commands, so writing back the value loaded
+    with the instance would undo concurrent changes.
+    """
+
+    derived_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.derived_fields
+            ]
+        super().save(*args, **kwargs)
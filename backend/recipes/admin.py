@@ -28,7 +28,7 @@ class TagInline(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'author', 'pub_date')
+    list_display = ('id', 'name', 'author', 'pub_date', 'favorites_count')
     list_filter = ('author', 'name', 'tags')
     exclude = ('tags',)
     inlines = [IngredientRecipeInline, TagInline]
@@ -0,0 +1,117 @@
+"""Home feed of recipes from followed authors.
+
+Recipes of authors with at most FEED_FANOUT_MAX_FOLLOWERS followers are
+pushed into a bounded FeedEntry list of every follower when published.
+Recipes of bigger authors are not copied and are read from Recipe
+directly when the feed is requested.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Subscription
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.FEED_FANOUT_WORKERS,
+    thread_name_prefix='feed-fanout'
+)
+
+
+def get_feed_filter(user):
+    big_authors = Subscription.objects.filter(
+        user=user,
+        author__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values('author_id')
+    return (
+        Q(id__in=FeedEntry.objects.filter(user=user).values('recipe_id'))
+        | Q(author_id__in=big_authors)
+    )
+
+
+def trim_feeds(users):
+    """Delete entries beyond FEED_MAX_LENGTH from the feeds of users.
+
+    users is a queryset of user ids; all feeds are trimmed by a single
+    statement instead of a query pair per follower.
+    """
+    users_sql, params = users.query.sql_with_params()
+    quote = connection.ops.quote_name
+    opts = FeedEntry._meta
+    table = quote(opts.db_table)
+    pk, user, recipe, pub_date = (
+        quote(opts.get_field(name).column)
+        for name in ('id', 'user', 'recipe', 'pub_date')
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM {table} WHERE {pk} IN ('
+            'SELECT {pk} FROM ('
+            'SELECT {pk}, ROW_NUMBER() OVER ('
+            'PARTITION BY {user} ORDER BY {pub_date} DESC, {recipe} DESC'
+            ') AS position FROM {table} WHERE {user} IN ({users})'
+            ') AS ranked WHERE position > %s)'.format(
+                table=table, pk=pk, user=user, recipe=recipe,
+                pub_date=pub_date, users=users_sql
+            ),
+            (*params, settings.FEED_MAX_LENGTH)
+        )
+
+
+def rebuild_feed(user_id):
+    recipes = Recipe.objects.filter(
+        author__subscribing__user_id=user_id,
+        author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).order_by('-pub_date', '-id').values_list('id', 'pub_date')
+    with transaction.atomic():
+        FeedEntry.objects.filter(user_id=user_id).delete()
+        FeedEntry.objects.bulk_create(
+            (FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                       pub_date=pub_date)
+             for recipe_id, pub_date
+             in recipes[:settings.FEED_MAX_LENGTH]),
+            batch_size=BATCH_SIZE
+        )
+
+
+def fan_out(recipe_id):
+    recipe = Recipe.objects.select_related('author').filter(
+        pk=recipe_id
+    ).first()
+    if (recipe is None
+            or recipe.author.followers_count
+            > settings.FEED_FANOUT_MAX_FOLLOWERS):
+        return
+    followers = Subscription.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=follower, recipe_id=recipe.id,
+                   pub_date=recipe.pub_date) for follower in followers),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    trim_feeds(followers)
+
+
+def run_in_background(recipe_id):
+    close_old_connections()
+    try:
+        fan_out(recipe_id)
+    except Exception:
+        logger.exception('Не удалось разослать рецепт %s в ленты', recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_fan_out(recipe_id):
+    transaction.on_commit(
+        lambda: executor.submit(run_in_background, recipe_id)
+    )
@@ -0,0 +1,69 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.cache import bump_version
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+BATCH_SIZE = 1000
+WEIGHTS = (
+    (Favorite, 1.0),
+    (ShoppingCart, 0.5),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рейтинг рецептов по недавним добавлениям '
+        'в избранное и корзину. Запускается периодически, например '
+        'из cron'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window',
+            type=int,
+            default=7,
+            help='Сколько последних дней учитывать'
+        )
+        parser.add_argument(
+            '--half-life',
+            type=float,
+            default=24,
+            help='Через сколько часов вклад добавления падает вдвое'
+        )
+
+    def handle(self, *args, **options):
+        if options['window'] < 1 or options['half_life'] <= 0:
+            raise CommandError(
+                'Окно и период полураспада должны быть положительными'
+            )
+        now = timezone.now()
+        since = now - timedelta(days=options['window'])
+        half_life = options['half_life'] * 3600
+        scores = defaultdict(float)
+        for model, weight in WEIGHTS:
+            events = model.objects.filter(added_at__gte=since).values_list(
+                'recipe_id', 'added_at'
+            )
+            for recipe_id, added_at in events.iterator():
+                age = (now - added_at).total_seconds()
+                scores[recipe_id] += weight * 0.5 ** (age / half_life)
+
+        with transaction.atomic():
+            Recipe.objects.filter(trending_score__gt=0).update(
+                trending_score=0
+            )
+            Recipe.objects.bulk_update(
+                [Recipe(id=recipe_id, trending_score=score)
+                 for recipe_id, score in scores.items()],
+                ['trending_score'],
+                batch_size=BATCH_SIZE
+            )
+        bump_version('recipes')
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинг обновлён у рецептов: {len(scores)}'
+        ))
@@ -0,0 +1,89 @@
+import json
+import sys
+import tarfile
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Выгружает рецепты в NDJSON (по рецепту на строку), '
+            'изображения - в tar.gz архив')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output',
+            help='Путь к NDJSON-файлу или - для вывода в stdout'
+        )
+        parser.add_argument('--media', help='Путь к tar.gz с изображениями')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def iterate_recipes(self, batch_size):
+        last_id = 0
+        while True:
+            recipes = list(
+                Recipe.objects.filter(id__gt=last_id).select_related(
+                    'author'
+                ).prefetch_related(
+                    'tags', 'amount_ingredients__ingredient'
+                ).order_by('id')[:batch_size]
+            )
+            if not recipes:
+                return
+            yield from recipes
+            last_id = recipes[-1].id
+
+    def serialize(self, recipe):
+        return {
+            'id': recipe.id,
+            'author': recipe.author.email,
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'pub_date': recipe.pub_date.isoformat(),
+            'image': recipe.image.name,
+            'tags': [
+                {'name': tag.name, 'color': tag.color, 'slug': tag.slug}
+                for tag in recipe.tags.all()
+            ],
+            'ingredients': [
+                {
+                    'name': amount.ingredient.name,
+                    'measurement_unit': amount.ingredient.measurement_unit,
+                    'amount': amount.amount,
+                }
+                for amount in recipe.amount_ingredients.all()
+            ],
+        }
+
+    def add_image(self, archive, name):
+        if not name or not default_storage.exists(name):
+            return
+        info = tarfile.TarInfo(name)
+        info.size = default_storage.size(name)
+        with default_storage.open(name) as image:
+            archive.addfile(info, image)
+
+    def handle(self, *args, **options):
+        output = (sys.stdout if options['output'] == '-'
+                  else open(options['output'], 'w', encoding='utf-8'))
+        archive = (tarfile.open(options['media'], 'w:gz')
+                   if options['media'] else None)
+        count = 0
+        try:
+            for recipe in self.iterate_recipes(options['batch_size']):
+                output.write(
+                    json.dumps(self.serialize(recipe), ensure_ascii=False)
+                    + '\n'
+                )
+                if archive is not None:
+                    self.add_image(archive, recipe.image.name)
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+            if archive is not None:
+                archive.close()
+        self.stderr.write(self.style.SUCCESS(f'Выгружено рецептов: {count}'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.renditions import generate_renditions, needs_renditions
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать превью у всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        count = 0
+        for recipe in Recipe.objects.only(
+            'image', 'image_card', 'image_detail'
+        ).iterator():
+            if options['all'] or needs_renditions(recipe):
+                generate_renditions(recipe.id)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {count}'
+        ))
@@ -1,20 +1,129 @@
 import csv
+import json
+import sys
+import time
+from itertools import islice
+from pathlib import Path
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
+from api.cache import bump_version
 from recipes.models import Ingredient
 
+CHUNK_SIZE = 64 * 1024
+HEADER = ['name', 'measurement_unit']
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if not row or row == HEADER:
+            continue
+        if len(row) != 2:
+            raise CommandError(f'Ожидались 2 колонки, получено: {row}')
+        yield row
+
+
+def read_ndjson(file):
+    for line in file:
+        if line.strip():
+            item = json.loads(line)
+            yield item['name'], item['measurement_unit']
+
+
+def read_json(file):
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидался JSON-массив ингредиентов')
+    position = 1
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('JSON-файл обрывается')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item['name'], item['measurement_unit']
+        position = end
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'ndjson': read_ndjson,
+}
+
 
 class Command(BaseCommand):
+    help = ('Импортирует ингредиенты из CSV, JSON или NDJSON пачками; '
+            'уже существующие пары название/единица пропускаются')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=str(Path(settings.BASE_DIR) / 'data' / 'ingredients.csv'),
+            help='Путь к файлу или - для чтения из stdin'
+        )
+        parser.add_argument(
+            '--format',
+            dest='file_format',
+            choices=READERS,
+            help='Формат файла; по умолчанию определяется по расширению'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def get_format(self, path, file_format):
+        if file_format:
+            return file_format
+        suffix = Path(path).suffix.lstrip('.').lower()
+        if suffix == 'jsonl':
+            return 'ndjson'
+        return suffix if suffix in READERS else 'csv'
+
+    def import_rows(self, rows, batch_size):
+        total = 0
+        ingredients = (
+            Ingredient(name=name.strip(), measurement_unit=unit.strip())
+            for name, unit in rows
+        )
+        while True:
+            batch = list(islice(ingredients, batch_size))
+            if not batch:
+                return total
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
+            self.stdout.write(f'Обработано строк: {total}', ending='\r')
 
     def handle(self, *args, **options):
-        with open(f'{settings.BASE_DIR}/data/ingredients.csv',
-                  'r',
-                  encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            Ingredient.objects.bulk_create(
-                Ingredient(**row) for row in reader
-            )
-
-        self.stdout.write(self.style.SUCCESS('Ингредиенты успешно загруженны'))
+        path = options['path']
+        reader = READERS[self.get_format(path, options['file_format'])]
+        before = Ingredient.objects.count()
+        started = time.perf_counter()
+        if path == '-':
+            total = self.import_rows(reader(sys.stdin), options['batch_size'])
+        else:
+            try:
+                with open(path, encoding='utf-8') as file:
+                    total = self.import_rows(
+                        reader(file), options['batch_size']
+                    )
+            except FileNotFoundError:
+                raise CommandError(f'Файл {path} не найден')
+        elapsed = time.perf_counter() - started
+        created = Ingredient.objects.count() - before
+        bump_version('ingredients')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Ингредиенты успешно загружены: строк {total}, '
+            f'добавлено {created}, пропущено {total - created}, '
+            f'{total / elapsed if elapsed else 0:.0f} строк/с'
+        ))
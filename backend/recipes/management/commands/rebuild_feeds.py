@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.feed import rebuild_feed
+from users.models import Subscription
+
+
+class Command(BaseCommand):
+    help = 'Заново заполняет ленты подписок пользователей'
+
+    def handle(self, *args, **options):
+        users = Subscription.objects.values_list(
+            'user_id', flat=True
+        ).distinct().order_by('user_id')
+        count = 0
+        for user_id in users.iterator():
+            rebuild_feed(user_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено лент: {count}'
+        ))
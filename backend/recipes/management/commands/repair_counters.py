@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.cache import bump_version
+from recipes.models import Favorite, Recipe
+from users.models import Subscription, User
+
+
+def count_by(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by().values(field)
+            .annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного, рецептов и подписчиков'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for model, counter, source, field in COUNTERS:
+                actual = count_by(source, field)
+                fixed = model.objects.exclude(**{counter: actual}).update(
+                    **{counter: actual}
+                )
+                self.stdout.write(
+                    f'{model._meta.model_name}.{counter}: '
+                    f'исправлено {fixed}'
+                )
+        bump_version('recipes')
+        bump_version('fragments')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Recipe
+from recipes.search import is_full_text_supported, update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поисковые векторы рецептов'
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if not is_full_text_supported(recipes):
+            raise CommandError(
+                'Полнотекстовый поиск доступен только в PostgreSQL'
+            )
+        count = update_search_vectors(recipes)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено рецептов: {count}'
+        ))
@@ -0,0 +1,24 @@
+# Generated by Django 3.2 on 2026-10-18 20:29
+
+import django.contrib.postgres.search
+from django.db import migrations
+import recipes.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=recipes.models.PostgresGinIndex(fields=['search_vector'], name='recipe_search_vector_idx'),
+        ),
+    ]
@@ -1,6 +1,10 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from django.utils import timezone
 
+from core.models import DerivedFieldsMixin
 from users.models import User
 
 
@@ -18,6 +22,12 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_measurement_unit'
+            )
+        ]
 
     def __str__(self):
         return f'{self.name} - {self.measurement_unit}'
@@ -52,7 +62,26 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class PostgresGinIndex(GinIndex):
+    """GIN index that is skipped outside PostgreSQL.
+
+    Keeps the schema buildable on SQLite, which is used for local tests.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return ''
+        return super().create_sql(model, schema_editor, using, **kwargs)
+
+    def remove_sql(self, model, schema_editor, **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return ''
+        return super().remove_sql(model, schema_editor, **kwargs)
+
+
+class Recipe(DerivedFieldsMixin, models.Model):
+    derived_fields = ('favorites_count', 'trending_score', 'search_vector')
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -67,6 +96,16 @@ class Recipe(models.Model):
         'Изображение',
         upload_to='recipes/images',
     )
+    image_card = models.ImageField(
+        'Изображение для карточки',
+        upload_to='recipes/renditions',
+        blank=True,
+    )
+    image_detail = models.ImageField(
+        'Изображение для страницы рецепта',
+        upload_to='recipes/renditions',
+        blank=True,
+    )
     text = models.TextField(
         'Описание',
         max_length=1000,
@@ -92,11 +131,44 @@ class Recipe(models.Model):
         'Дата и время публикации рецепта',
         auto_now_add=True
     )
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное',
+        default=0,
+        editable=False
+    )
+    trending_score = models.FloatField(
+        'Рейтинг популярности за последнее время',
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date', '-id'],
+                name='recipe_popular_idx'
+            ),
+            models.Index(
+                fields=['-trending_score', '-pub_date', '-id'],
+                name='recipe_trending_idx'
+            ),
+            PostgresGinIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -150,6 +222,10 @@ class Favorite(models.Model):
         related_name='favorites',
         verbose_name='Рецепт'
     )
+    added_at = models.DateTimeField(
+        'Дата добавления',
+        default=timezone.now
+    )
 
     class Meta:
         verbose_name = 'Избранный рецепт'
@@ -160,6 +236,16 @@ class Favorite(models.Model):
                 name='unique_favourites'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'],
+                name='favorite_recipe_user_idx'
+            ),
+            models.Index(
+                fields=['added_at'],
+                name='favorite_added_at_idx'
+            )
+        ]
         ordering = ['user']
 
     def __str__(self):
@@ -179,6 +265,10 @@ class ShoppingCart(models.Model):
         related_name='cart',
         verbose_name='Рецепт'
     )
+    added_at = models.DateTimeField(
+        'Дата добавления',
+        default=timezone.now
+    )
 
     class Meta:
         verbose_name = 'Корзина покупок'
@@ -189,7 +279,52 @@ class ShoppingCart(models.Model):
                 name='unique_shopping_cart'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'],
+                name='shopping_cart_recipe_user_idx'
+            ),
+            models.Index(
+                fields=['added_at'],
+                name='shopping_cart_added_at_idx'
+            )
+        ]
         ordering = ['user']
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в корзину покупок'
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField('Дата и время публикации рецепта')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_entry_user_pub_date_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
@@ -0,0 +1,94 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {
+    'image_card': (480, 360),
+    'image_detail': (1200, 900),
+}
+FORMATS = {
+    'WEBP': 'webp',
+    'JPEG': 'jpg',
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_RENDITION_WORKERS,
+    thread_name_prefix='image-renditions'
+)
+
+
+def get_rendition_name(image_name, field):
+    extension = FORMATS[settings.IMAGE_RENDITION_FORMAT]
+    return f'recipes/renditions/{Path(image_name).stem}_{field}.{extension}'
+
+
+def get_rendition(recipe, field):
+    rendition = getattr(recipe, field)
+    if not recipe.image or not rendition:
+        return None
+    prefix = get_rendition_name(recipe.image.name, field).rsplit('.', 1)[0]
+    return rendition if rendition.name.startswith(prefix) else None
+
+
+def needs_renditions(recipe):
+    return bool(recipe.image) and any(
+        get_rendition(recipe, field) is None for field in RENDITIONS
+    )
+
+
+def generate_renditions(recipe_id):
+    recipe = Recipe.objects.only(
+        'image', *RENDITIONS
+    ).filter(id=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    with recipe.image.open('rb') as file:
+        image = ImageOps.exif_transpose(Image.open(file)).convert('RGB')
+    renditions = {}
+    for field, size in RENDITIONS.items():
+        rendition = image.copy()
+        rendition.thumbnail(size)
+        buffer = io.BytesIO()
+        rendition.save(buffer, settings.IMAGE_RENDITION_FORMAT, quality=80)
+        old_name = getattr(recipe, field).name
+        if old_name and default_storage.exists(old_name):
+            default_storage.delete(old_name)
+        renditions[field] = default_storage.save(
+            get_rendition_name(recipe.image.name, field),
+            ContentFile(buffer.getvalue())
+        )
+    Recipe.objects.filter(
+        id=recipe_id, image=recipe.image.name
+    ).update(**renditions)
+
+    from api.cache import bump_version
+    from api.fragments import refresh_recipe_fragments
+    refresh_recipe_fragments([recipe_id])
+    bump_version('recipes')
+
+
+def run_in_background(recipe_id):
+    close_old_connections()
+    try:
+        generate_renditions(recipe_id)
+    except Exception:
+        logger.exception('Не удалось создать превью рецепта %s', recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_renditions(recipe_id):
+    transaction.on_commit(
+        lambda: executor.submit(run_in_background, recipe_id)
+    )
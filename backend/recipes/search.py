@@ -0,0 +1,74 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchHeadline, SearchQuery,
+                                            SearchRank, SearchVector)
+from django.db import connections
+from django.db.models import F, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Coalesce, Replace
+
+from recipes.models import IngredientRecipes
+
+SEARCH_CONFIG = 'russian'
+HTML_ESCAPES = (
+    ('&', '&amp;'),
+    ('<', '&lt;'),
+    ('>', '&gt;'),
+    ('"', '&quot;'),
+    ("'", '&#x27;'),
+)
+
+
+def is_full_text_supported(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def get_search_vector():
+    ingredients = Subquery(
+        IngredientRecipes.objects.filter(recipe=OuterRef('pk'))
+        .order_by().values('recipe')
+        .annotate(names=StringAgg('ingredient__name', ' '))
+        .values('names'),
+        output_field=TextField()
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(
+            Coalesce(ingredients, Value(''), output_field=TextField()),
+            weight='C',
+            config=SEARCH_CONFIG
+        )
+    )
+
+
+def escape_html(field):
+    # ts_headline copies the source text as is, so it is escaped before
+    # the <mark> tags are added to keep the snippet safe to render.
+    expression = F(field)
+    for char, entity in HTML_ESCAPES:
+        expression = Replace(expression, Value(char), Value(entity))
+    return expression
+
+
+def update_search_vectors(queryset):
+    if not is_full_text_supported(queryset):
+        return 0
+    return queryset.update(search_vector=get_search_vector())
+
+
+def search_recipes(queryset, value):
+    if not is_full_text_supported(queryset):
+        return queryset.filter(
+            Q(name__icontains=value)
+            | Q(text__icontains=value)
+            | Q(id__in=IngredientRecipes.objects.filter(
+                ingredient__name__icontains=value
+            ).values('recipe_id'))
+        )
+    query = SearchQuery(value, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(search_vector=query).annotate(
+        search_rank=SearchRank(F('search_vector'), query),
+        search_snippet=SearchHeadline(
+            escape_html('text'), query, config=SEARCH_CONFIG,
+            start_sel='<mark>', stop_sel='</mark>', max_words=30
+        )
+    ).order_by('-search_rank', '-pub_date', '-id')
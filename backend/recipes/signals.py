@@ -0,0 +1,78 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.feed import rebuild_feed, schedule_fan_out
+from recipes.models import Favorite, FeedEntry, Ingredient, Recipe
+from recipes.renditions import needs_renditions, schedule_renditions
+from recipes.search import update_search_vectors
+from users.models import Subscription, User
+
+
+@receiver(post_save, sender=Recipe)
+def create_image_renditions(instance, **kwargs):
+    if needs_renditions(instance):
+        schedule_renditions(instance.id)
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(instance, created, **kwargs):
+    if created:
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(instance, **kwargs):
+    transaction.on_commit(lambda: update_search_vectors(
+        Recipe.objects.filter(pk=instance.pk)
+    ))
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search_vectors(instance, created, **kwargs):
+    if not created:
+        update_search_vectors(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver(post_save, sender=Recipe)
+def push_to_feeds(instance, created, **kwargs):
+    if created:
+        schedule_fan_out(instance.id)
+
+
+@receiver(post_save, sender=Subscription)
+def fill_feed(instance, created, **kwargs):
+    if created:
+        rebuild_feed(instance.user_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def clear_feed(instance, **kwargs):
+    FeedEntry.objects.filter(
+        user_id=instance.user_id, recipe__author_id=instance.author_id
+    ).delete()
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(instance, **kwargs):
+    User.objects.filter(pk=instance.author_id, recipes_count__gt=0).update(
+        recipes_count=F('recipes_count') - 1
+    )
+
+
+@receiver(post_save, sender=Favorite)
+def increment_favorites_count(instance, created, **kwargs):
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def decrement_favorites_count(instance, **kwargs):
+    Recipe.objects.filter(
+        pk=instance.recipe_id, favorites_count__gt=0
+    ).update(favorites_count=F('favorites_count') - 1)
@@ -4,7 +4,10 @@ from users.models import Subscription, User
 
 
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('id', 'first_name', 'last_name', 'email')
+    list_display = (
+        'id', 'first_name', 'last_name', 'email',
+        'recipes_count', 'followers_count'
+    )
     search_fields = ('first_name',)
     list_filter = ('email', 'first_name')
 
@@ -1,8 +1,12 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from core.models import DerivedFieldsMixin
+
+
+class User(DerivedFieldsMixin, AbstractUser):
+    derived_fields = ('recipes_count', 'followers_count')
 
-class User(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = [
         'username',
@@ -29,6 +33,16 @@ class User(AbstractUser):
         blank=False,
         null=False
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -59,3 +73,9 @@ class Subscription(models.Model):
         constraints = [models.UniqueConstraint(
             fields=['user', 'author'], name='unique_subscriber'
         )]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='subscription_author_user_idx'
+            )
+        ]